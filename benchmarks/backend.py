@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+'''
+Compare the 'permutation' and 'array' Fatgraph backends on random
+one-vertex chord diagrams, the shape produced by Fatgraph.from_hbonds.
+'''
+
+import argparse, random, time
+
+from fatgraph import Fatgraph
+
+
+def chord_diagram(n, rng):
+    halfedges = list(range(1, 2*n + 1))
+    rng.shuffle(halfedges)
+    edges = [tuple(sorted(halfedges[i:i+2]))
+             for i in range(0, len(halfedges), 2)]
+    return [tuple(range(1, 2*n + 1))], edges
+
+
+def timeit(vertices, edges, backend, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fg = Fatgraph(vertices, edges, backend=backend)
+        fg.genus
+        best = min(best, time.perf_counter() - start)
+    return best, fg.genus
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--sizes', type=int, nargs='+',
+                        default=[50, 100, 200, 400],
+                        help='Numbers of edges to benchmark.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Repetitions per size; the best is kept.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    print('edges\tpermutation\tarray\tspeedup')
+    for n in args.sizes:
+        vertices, edges = chord_diagram(n, rng)
+        tp, gp = timeit(vertices, edges, 'permutation', args.repeat)
+        ta, ga = timeit(vertices, edges, 'array', args.repeat)
+        assert gp == ga
+        print('{}\t{:.4f}\t{:.4f}\t{:.1f}x'.format(n, tp, ta, tp / ta))
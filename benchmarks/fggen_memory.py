@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+'''
+Peak memory of fggen.generateall against the streaming fggen.iter_all
+when computing the genus distribution of connected graphs.
+'''
+
+import argparse, time, tracemalloc
+from collections import Counter
+
+from fatgraph import fggen
+
+
+def listbased(valences, l):
+    return Counter(fg.genus for fg in fggen.generateall(*valences, l=l)
+                   if fg.isconnected())
+
+
+def streaming(valences, l):
+    return Counter(fg.genus for fg in fggen.iter_all(*valences, l=l,
+                                                     connected=True))
+
+
+def measure(func, valences, l):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(valences, l)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('valences', type=int, nargs='*',
+                        default=[4, 4, 4, 4])
+    parser.add_argument('-l', type=int, default=0,
+                        help='Number of marked points.')
+    args = parser.parse_args()
+    print('path\tseconds\tpeak MiB')
+    results = []
+    for func in (listbased, streaming):
+        result, elapsed, peak = measure(func, args.valences, args.l)
+        results.append(result)
+        print('{}\t{:.2f}\t{:.1f}'.format(func.__name__, elapsed,
+                                         peak / 2**20))
+    assert results[0] == results[1]
+    print('genus distribution:', dict(sorted(results[0].items())))
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+'''
+Time and peak memory of the hot paths of the fatgraph package over
+inputs of increasing size, all generated offline from a fixed seed:
+one-vertex chord diagrams and graphs on several vertices for genus
+and isconnected, valence sequences for generateall and generateallB,
+synthetic H-bond files for from_hbonds, random beta sheets for
+from_pmat, and InvariantCache hits against recomputing the genus.
+
+    PYTHONPATH=. python benchmarks/suite.py --save baseline.json
+    PYTHONPATH=. python benchmarks/suite.py --compare baseline.json
+
+With --compare, every result more than --tolerance slower or larger
+than the baseline is reported as a regression and the exit status is
+1. Time is the best of --repeat runs; peak memory is measured with
+tracemalloc in a separate run.
+'''
+
+import argparse, fnmatch, json, os, platform, random, sys, tempfile, \
+    time, tracemalloc
+
+import numpy as np
+
+from fatgraph import Fatgraph, FatgraphB, fggen
+from fatgraph.cache import InvariantCache, contenthash
+
+# Results below these are treated as equal to the baseline whatever
+# the ratio, since they are mostly timer and allocator noise.
+MIN_SECONDS = 0.005
+MIN_BYTES = 64 * 1024
+
+
+def chord_diagram(n, rng):
+    halfedges = list(range(1, 2*n + 1))
+    rng.shuffle(halfedges)
+    edges = [tuple(sorted(halfedges[i:i+2]))
+             for i in range(0, len(halfedges), 2)]
+    return [tuple(range(1, 2*n + 1))], edges
+
+
+def random_graph(n, rng):
+    "n 4-valent vertices with random edges and a few unpaired half-edges."
+    vertices = fggen.makevertices(*[4] * n)
+    halfedges = [h for v in vertices for h in v]
+    rng.shuffle(halfedges)
+    m = len(halfedges) // 2 - n // 4
+    edges = [tuple(halfedges[2*i:2*i+2]) for i in range(m)]
+    return vertices, edges
+
+
+def hbond_file(n, rng, directory):
+    '''
+    Write an H-bond file for a chain of n residues: a helix from the
+    start and a sheet of hairpins after it, plus filtered-out lines.
+    '''
+    lines = []
+    cols = ['x'] * 22
+
+    def bond(donor, acceptor, flags='AA__UU'):
+        cols[12], cols[13], cols[21] = str(donor), str(acceptor), flags
+        lines.append(' '.join(cols) + '\n')
+
+    for i in range(1, n // 2 - 4):
+        bond(i + 4, i)
+    for i in range(n // 2, n - 6, 6):
+        bond(i + 5, i, 'AA__SU')
+        bond(i, i + 5 - rng.randrange(2), 'AA__US')
+        bond(i + 2, rng.randrange(1, n), 'AB_XUU')
+    path = os.path.join(directory, 'chain{}.hb'.format(n))
+    with open(path, 'w') as fh:
+        fh.writelines(lines)
+    return path
+
+
+def pairing_matrix(n, rng):
+    "Random beta sheets on n strands, as a dense pairing matrix."
+    mat = np.zeros((n, n), dtype=int)
+    strands = list(range(n))
+    rng.shuffle(strands)
+    while strands:
+        size = min(rng.randint(1, 6), len(strands))
+        sheet, strands = strands[:size], strands[size:]
+        for i, j in zip(sheet, sheet[1:]):
+            if rng.random() < 0.5:
+                mat[min(i, j), max(i, j)] = 1
+            else:
+                mat[max(i, j), min(i, j)] = 1
+    return mat
+
+
+def cached_sheets(n, rng, directory):
+    """
+    Vertices and edges of n random 20-strand sheets, and a cache file
+    already holding their invariants.
+    """
+    graphs = [FatgraphB.from_pmat(pairing_matrix(20, rng)) for _ in range(n)]
+    graphs = [(fg.vertices, fg.edges) for fg in graphs]
+    path = os.path.join(directory, 'cache{}.db'.format(n))
+    with InvariantCache(path) as cache:
+        for vertices, edges in graphs:
+            Fatgraph(vertices, edges).invariants(cache)
+    return graphs, path
+
+
+def cache_hits(graphs, path):
+    with InvariantCache(path) as cache:
+        return [cache.get(contenthash(v, e))['genus'] for v, e in graphs]
+
+
+# Each case maps a name to its default sizes, the sizes added by
+# --large, a setup function turning (size, rng, directory) into the
+# arguments of the timed function, and the timed function itself.
+CASES = {
+    'genus': ([25, 50, 100, 200], [400, 800],
+              lambda n, rng, d: chord_diagram(n, rng),
+              lambda vertices, edges: Fatgraph(vertices, edges).genus),
+    'genus_array': ([100, 200, 400, 800], [1600, 3200],
+                    lambda n, rng, d: chord_diagram(n, rng),
+                    lambda vertices, edges:
+                    Fatgraph(vertices, edges, backend='array').genus),
+    'isconnected': ([50, 100, 200, 400], [800, 1600],
+                    lambda n, rng, d: (Fatgraph(*random_graph(n, rng)),),
+                    lambda fg: fg.isconnected()),
+    'generateall': ([1, 2, 3], [4],
+                    lambda n, rng, d: [4] * n,
+                    lambda valences: len(fggen.generateall(*valences))),
+    'generateallB': ([1, 2], [3],
+                     lambda n, rng, d: [4] * n,
+                     lambda valences: len(fggen.generateallB(*valences))),
+    'from_hbonds': ([50, 100, 200, 400], [800, 1600],
+                    lambda n, rng, d: (hbond_file(n, rng, d),),
+                    lambda path: Fatgraph.from_hbonds(path).genus),
+    # Compare with recompute: a hit must be cheaper than the genus.
+    'cache_hit': ([100, 500], [5000],
+                  cached_sheets, cache_hits),
+    'recompute': ([100, 500], [5000],
+                  cached_sheets,
+                  lambda graphs, path: [Fatgraph(v, e).genus
+                                        for v, e in graphs]),
+    'from_pmat': ([10, 20, 40, 80], [160, 320],
+                  lambda n, rng, d: (pairing_matrix(n, rng),),
+                  lambda mat: FatgraphB.from_pmat(mat)),
+}
+
+
+def measure(func, args, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(names, large=False, repeat=5, seed=0):
+    '''
+    Return {case: {size: {'seconds': ..., 'peak_bytes': ...}}} for the
+    cases in names, printing one line per result as it is measured.
+    '''
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            sizes, extra, setup, func = CASES[name]
+            results[name] = {}
+            for size in sizes + (extra if large else []):
+                rng = random.Random('{}/{}/{}'.format(seed, name, size))
+                args = setup(size, rng, directory)
+                if not isinstance(args, tuple):
+                    args = (args,)
+                seconds, peak = measure(func, args, repeat)
+                results[name][str(size)] = {'seconds': seconds,
+                                            'peak_bytes': peak}
+                print('{}\t{}\t{:.4f}\t{:.2f}'.format(
+                    name, size, seconds, peak / 2**20), flush=True)
+    return results
+
+
+def exponents(results):
+    '''
+    Yield (case, k) where the time of the case grows like size**k,
+    fitted over the sizes taking at least MIN_SECONDS.
+    '''
+    for name, sizes in results.items():
+        points = [(float(size), r['seconds']) for size, r in sizes.items()
+                  if r['seconds'] >= MIN_SECONDS]
+        if len(points) > 1:
+            x, y = np.log(np.array(points)).T
+            yield name, np.polyfit(x, y, 1)[0]
+
+
+def regressions(results, baseline, tolerance):
+    '''
+    Yield (case, size, measure, baseline value, new value) for every
+    result worse than the baseline by more than the tolerance.
+    '''
+    for name, sizes in results.items():
+        for size, new in sizes.items():
+            old = baseline.get(name, {}).get(size)
+            if old is None:
+                continue
+            for key, floor in (('seconds', MIN_SECONDS),
+                               ('peak_bytes', MIN_BYTES)):
+                if new[key] > old[key] * (1 + tolerance) and \
+                   new[key] - old[key] > floor:
+                    yield name, size, key, old[key], new[key]
+
+
+def metadata():
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cases', nargs='*', default=['*'],
+                        help='Cases to run, glob patterns allowed '
+                        '(default: all of {}).'.format(', '.join(CASES)))
+    parser.add_argument('--large', action='store_true',
+                        help='Also run the larger sizes.')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Repetitions per size; the best is kept.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save',
+                        help='Write the results to this JSON file.')
+    parser.add_argument('--compare',
+                        help='Compare the results with this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed relative slowdown or growth before '
+                        'a result counts as a regression.')
+    args = parser.parse_args()
+    names = [name for name in CASES
+             if any(fnmatch.fnmatch(name, c) for c in args.cases)]
+    print('case\tsize\tseconds\tpeak MiB')
+    results = run(names, args.large, args.repeat, args.seed)
+    for name, k in exponents(results):
+        print('{}: time ~ size^{:.1f}'.format(name, k))
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump({'meta': metadata(), 'results': results}, fh,
+                      indent=1)
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        found = list(regressions(results, baseline['results'],
+                                 args.tolerance))
+        for name, size, key, old, new in found:
+            print('REGRESSION {} size {} {}: {:.4g} -> {:.4g} '
+                  '({:+.0%})'.format(name, size, key, old, new,
+                                     new / old - 1))
+        if found:
+            sys.exit(1)
+        print('No regressions against {}.'.format(args.compare))
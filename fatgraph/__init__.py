@@ -0,0 +1,2 @@
+from .fatgraph import Fatgraph, FatgraphB, VertexSkeleton, filter_connected
+from .batch import FatgraphBatch
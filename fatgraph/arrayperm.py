@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def cycle_labels(image, maxlength=None):
+    '''
+    Label every point of a permutation with the smallest point of its
+    cycle. image is an integer array whose last axis is the image of
+    0, 1, ..., n-1, so a 2-d array is treated as a batch of
+    permutations of the same size. Runs in O(n log n) array operations
+    by pointer jumping, or O(n log maxlength) if no cycle is longer
+    than maxlength.
+    '''
+    image = np.asarray(image)
+    labels = np.broadcast_to(np.arange(image.shape[-1]),
+                             image.shape).copy()
+    jump = image.copy()
+    if maxlength is None:
+        maxlength = image.shape[-1]
+    step = 1
+    while step < maxlength:
+        labels = np.minimum(labels,
+                            np.take_along_axis(labels, jump, axis=-1))
+        jump = np.take_along_axis(jump, jump, axis=-1)
+        step *= 2
+    return labels
+
+
+def count_cycles(image):
+    '''
+    Number of cycles, including fixed points, of the permutation(s)
+    in image. See cycle_labels.
+    '''
+    labels = cycle_labels(image)
+    return np.count_nonzero(labels == np.arange(labels.shape[-1]),
+                            axis=-1)
+
+
+class ArrayPermutation(object):
+    '''
+    A permutation of the positive integers stored as a flat NumPy
+    array indexed by point, with index 0 unused. It implements the
+    part of the permutation.Permutation interface used by Fatgraph,
+    with the same conventions: (p * q)(i) == p(q(i)), and to_cycles()
+    omits fixed points and lists each cycle from its smallest point.
+    '''
+
+    __slots__ = ('_image',)
+
+    def __init__(self, image=(0,)):
+        self._image = np.asarray(image, dtype=np.intp)
+
+    @classmethod
+    def from_cycles(cls, *cycles):
+        points = [i for c in cycles for i in c]
+        image = np.arange(max(points, default=0) + 1)
+        for c in cycles:
+            if len(c) > 1:
+                image[list(c)] = list(c[1:]) + [c[0]]
+        return cls(image)
+
+    @property
+    def degree(self):
+        moved = np.flatnonzero(self._image != np.arange(len(self._image)))
+        return int(moved[-1]) if len(moved) else 0
+
+    def __call__(self, i):
+        if i < len(self._image):
+            return int(self._image[i])
+        return i
+
+    def __mul__(self, other):
+        n = max(len(self._image), len(other._image))
+        return type(self)(self._padded(n)[other._padded(n)])
+
+    def __eq__(self, other):
+        if isinstance(other, ArrayPermutation):
+            return self.to_image() == other.to_image()
+        elif hasattr(other, 'to_image'):
+            return self.to_image() == tuple(other.to_image())
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '{}.from_cycles{}'.format(type(self).__name__,
+                                         tuple(self.to_cycles()))
+
+    def _padded(self, n):
+        if len(self._image) == n:
+            return self._image
+        return np.concatenate([self._image,
+                               np.arange(len(self._image), n)])
+
+    def to_image(self):
+        return tuple(self._image[1:self.degree + 1].tolist())
+
+    def to_cycles(self):
+        image = self._image.tolist()
+        seen = [False] * len(image)
+        cycles = []
+        for i in range(1, len(image)):
+            if seen[i] or image[i] == i:
+                continue
+            cycle = []
+            j = i
+            while not seen[j]:
+                seen[j] = True
+                cycle.append(j)
+                j = image[j]
+            cycles.append(tuple(cycle))
+        return cycles
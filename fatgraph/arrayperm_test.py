@@ -0,0 +1,29 @@
+import numpy as np
+from permutation import Permutation
+from .arrayperm import ArrayPermutation, count_cycles
+
+
+class TestArrayPermutation(object):
+    def test_matches_permutation(self):
+        cycles = [(3,1,2), (5,4), (6,)]
+        a = ArrayPermutation.from_cycles(*cycles)
+        p = Permutation.from_cycles(*cycles)
+        assert a.to_cycles() == p.to_cycles()
+        assert a == p and p == a
+        assert a.degree == p.degree
+        q = [(1,4), (2,6)]
+        assert (a * ArrayPermutation.from_cycles(*q)).to_cycles() == \
+            (p * Permutation.from_cycles(*q)).to_cycles()
+        assert a(3) == p(3) and a(10) == 10
+
+    def test_equality(self):
+        assert ArrayPermutation.from_cycles((1,2), (5,)) == \
+            ArrayPermutation.from_cycles((2,1))
+        assert ArrayPermutation.from_cycles(()) == ArrayPermutation()
+        assert ArrayPermutation.from_cycles((1,2)) != \
+            ArrayPermutation.from_cycles((1,3))
+
+    def test_count_cycles(self):
+        assert count_cycles(np.array([0, 2, 1, 4, 5, 3])) == 3
+        batch = np.array([[0, 1, 2, 3], [1, 2, 3, 0]])
+        assert list(count_cycles(batch)) == [4, 1]
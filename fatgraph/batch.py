@@ -0,0 +1,236 @@
+'''
+Many fatgraphs packed into flat NumPy arrays, so that invariants such
+as the genus are computed for all of them at once with array
+operations instead of one Fatgraph and one permutation at a time.
+
+The half-edges of all graphs are numbered 0, 1, ..., N-1 in the flat
+arrays, graph k owning positions offsets[k] to offsets[k+1]-1 in the
+order of Fatgraph.halfedges. labels holds the original number of each
+half-edge, and sigma and eps the vertex and edge permutations as
+arrays of positions. Since no cycle leaves its graph the boundaries of
+every graph are the cycles of the single flat permutation sigma[eps].
+'''
+
+import numpy as np
+
+from .arrayperm import cycle_labels
+from .fatgraph import Fatgraph
+
+
+class FatgraphBatch(object):
+    '''
+    A sequence of fatgraphs stored as flat arrays, see the module
+    docstring. batch[k] returns graph k as a Fatgraph, equal to the one
+    it was made from. nvertices, nedges, nboundaries and genus are
+    arrays with one entry per graph that agree with the Fatgraph
+    properties of the same names.
+    '''
+
+    def __init__(self, offsets, labels, sigma, eps, nvertices=None,
+                 nedges=None):
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+        self.labels = np.asarray(labels)
+        self.sigma = np.asarray(sigma, dtype=np.intp)
+        self.eps = np.asarray(eps, dtype=np.intp)
+        self._cache = {}
+        if nvertices is not None:
+            self._cache['nvertices'] = np.asarray(nvertices)
+        if nedges is not None:
+            self._cache['nedges'] = np.asarray(nedges)
+
+    @classmethod
+    def from_csr(cls, ventry, vstart, vflat, eentry, estart, eflat):
+        '''
+        Make a batch from vertices and edges in the layout of
+        fatgraph.corpus: the half-edges of all tuples in flat, tuple
+        j being flat[start[j]:start[j+1]], and the tuples of graph k
+        being j = entry[k], ..., entry[k+1]-1. Edges may only use
+        half-edges of the vertices of their own graph.
+        '''
+        ventry, vstart = np.asarray(ventry), np.asarray(vstart)
+        eentry, estart = np.asarray(eentry), np.asarray(estart)
+        labels = np.asarray(vflat)
+        eflat = np.asarray(eflat)
+        ngraphs = len(ventry) - 1
+        if len(eentry) - 1 != ngraphs:
+            raise ValueError('Vertices and edges are for different '
+                             'numbers of graphs')
+        offsets = vstart[ventry]
+        sigma = _cycles(vstart, len(labels))
+        vgraph = _owner(ventry)
+        egraph = _owner(eentry)
+
+        # Find the position of every half-edge of the edges by looking
+        # up (graph, label) among those of the vertices.
+        low = min(labels.min(initial=0), eflat.min(initial=0))
+        span = int(max(labels.max(initial=0), eflat.max(initial=0))) - \
+            int(low) + 1
+        vkeys = np.repeat(vgraph, np.diff(vstart)) * span + (labels - low)
+        order = np.argsort(vkeys, kind='stable')
+        sortedkeys = vkeys[order]
+        if np.any(sortedkeys[1:] == sortedkeys[:-1]):
+            raise ValueError('Vertices are not unique')
+        ekeys = np.repeat(egraph, np.diff(estart)) * span + (eflat - low)
+        found = np.searchsorted(sortedkeys, ekeys)
+        found[found == len(sortedkeys)] = 0
+        if len(ekeys) and not np.array_equal(sortedkeys[found], ekeys):
+            raise ValueError('Edges do not connect to vertices')
+        positions = order[found]
+        if len(np.unique(positions)) != len(positions):
+            raise ValueError('Edges are not unique')
+        eps = np.arange(len(labels))
+        eps[positions] = positions[_cycles(estart, len(eflat))]
+
+        return cls(offsets, labels, sigma, eps,
+                   _nontrivial(vstart, vgraph, ngraphs),
+                   _nontrivial(estart, egraph, ngraphs))
+
+    @classmethod
+    def from_graphs(cls, graphs):
+        "Make a batch from an iterable of (vertices, edges) pairs."
+        parts = ([0], [0], [], [0], [0], [])
+        ventry, vstart, vflat, eentry, estart, eflat = parts
+        for vertices, edges in graphs:
+            for tuples, entry, start, flat in \
+                    ((vertices, ventry, vstart, vflat),
+                     (edges, eentry, estart, eflat)):
+                for t in tuples:
+                    flat.extend(t)
+                    start.append(len(flat))
+                entry.append(len(start) - 1)
+        return cls.from_csr(*(np.array(p, dtype=np.intp) for p in parts))
+
+    @classmethod
+    def from_fatgraphs(cls, fatgraphs):
+        "Make a batch from an iterable of Fatgraphs."
+        return cls.from_graphs((fg.vertices, fg.edges) for fg in fatgraphs)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def __getitem__(self, k):
+        return self.fatgraph(k)
+
+    def fatgraph(self, k, backend='permutation'):
+        "Graph k as a Fatgraph."
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError('FatgraphBatch index out of range')
+        start, stop = self.offsets[k], self.offsets[k+1]
+        labels = self.labels[start:stop].tolist()
+        sigma = (self.sigma[start:stop] - start).tolist()
+        eps = (self.eps[start:stop] - start).tolist()
+        vertices = [tuple(labels[i] for i in c)
+                    for c in _walk(sigma, True)]
+        edges = [tuple(labels[i] for i in c) for c in _walk(eps, False)]
+        return Fatgraph(vertices, edges, backend)
+
+    def to_fatgraphs(self, backend='permutation'):
+        return [self.fatgraph(k, backend) for k in range(len(self))]
+
+    def _cached(self, key, compute):
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = compute()
+            return value
+
+    @property
+    def _graph(self):
+        "Index of the graph of every half-edge."
+        return self._cached('graph', lambda: _owner(self.offsets))
+
+    @property
+    def _maxlength(self):
+        "Number of half-edges of the largest graph, bounding any cycle."
+        return self._cached(
+            'maxlength', lambda: int(np.diff(self.offsets).max(initial=0)))
+
+    def _ncycles(self, image, nontrivial):
+        labels = cycle_labels(image, self._maxlength)
+        roots = labels == np.arange(len(labels))
+        if nontrivial:
+            roots &= image != np.arange(len(image))
+        return np.bincount(self._graph[roots], minlength=len(self))
+
+    @property
+    def nvertices(self):
+        "Number of non-trivial cycles of each vertex permutation."
+        return self._cached('nvertices',
+                            lambda: self._ncycles(self.sigma, True))
+
+    @property
+    def nedges(self):
+        "Number of non-trivial cycles of each edge permutation."
+        return self._cached('nedges', lambda: self._ncycles(self.eps, True))
+
+    @property
+    def nboundaries(self):
+        return self._cached('nboundaries', self._nboundaries)
+
+    def _nboundaries(self):
+        # Like Fatgraph, count the fixed points of sigma*eps only when
+        # they lie on a non-trivial vertex.
+        points = np.arange(len(self.sigma))
+        alone = (self.sigma == points) & (self.eps == points)
+        return self._ncycles(self.sigma[self.eps], False) - \
+            np.bincount(self._graph[alone], minlength=len(self))
+
+    @property
+    def genus(self):
+        return self._cached('genus', self._genus)
+
+    def _genus(self):
+        genus = np.trunc((2 - self.nvertices + self.nedges
+                          - self.nboundaries) / 2).astype(int)
+        genus[self.nvertices == 0] = 0
+        return genus
+
+
+def _owner(entry):
+    "Index k of the range entry[k]:entry[k+1] containing each position."
+    entry = np.asarray(entry)
+    return np.repeat(np.arange(len(entry) - 1), np.diff(entry))
+
+
+def _cycles(start, size):
+    '''
+    Image of the permutation of range(size) whose cycles are the
+    consecutive ranges start[j]:start[j+1], each in increasing order.
+    '''
+    image = np.arange(size) + 1
+    start = np.asarray(start)
+    first, last = start[:-1], start[1:] - 1
+    nonempty = last >= first
+    image[last[nonempty]] = first[nonempty]
+    return image
+
+
+def _nontrivial(start, graph, ngraphs):
+    "Number of tuples of more than one half-edge in each graph."
+    return np.bincount(graph[np.diff(start) > 1], minlength=ngraphs)
+
+
+def _walk(image, fixed):
+    '''
+    Cycles of a permutation given as a list, from the first point of
+    each in the list order, including fixed points if fixed is true.
+    '''
+    seen = [False] * len(image)
+    cycles = []
+    for i in range(len(image)):
+        if seen[i] or (not fixed and image[i] == i):
+            continue
+        cycle = []
+        j = i
+        while not seen[j]:
+            seen[j] = True
+            cycle.append(j)
+            j = image[j]
+        cycles.append(cycle)
+    return cycles
@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+from .fatgraph import Fatgraph
+from .batch import FatgraphBatch
+from .corpus import Corpus, write_corpus
+from . import fggen
+
+GRAPHS = [Fatgraph([(1,2,3,4)], [(1,2), (3,4)]),
+          Fatgraph([(1,2,3,4)], [(1,3), (2,4)]),
+          Fatgraph([(1,2,3), (4,5,6)], [(1,4), (2,5), (3,6)]),
+          Fatgraph([(1,2), (3,4), (5,6)], [(1,3), (2,4)]),
+          Fatgraph([(1,2), (3,)], [(2,3)]),
+          Fatgraph([(3,), (1,)], [(1,3)]),
+          Fatgraph([(10,), (20,)], []),
+          Fatgraph([()], [()])]
+
+
+class TestFatgraphBatch(object):
+    def check(self, batch, fgs):
+        assert len(batch) == len(fgs)
+        assert batch.genus.tolist() == [fg.genus for fg in fgs]
+        assert batch.nboundaries.tolist() == [fg.nboundaries for fg in fgs]
+        assert batch.nvertices.tolist() == [fg.nvertices for fg in fgs]
+        assert batch.nedges.tolist() == [fg.nedges for fg in fgs]
+
+    def test_invariants(self):
+        batch = FatgraphBatch.from_fatgraphs(GRAPHS)
+        self.check(batch, GRAPHS)
+        # Counted from the cycles when not given to the constructor
+        self.check(FatgraphBatch(batch.offsets, batch.labels,
+                                 batch.sigma, batch.eps), GRAPHS)
+
+    def test_roundtrip(self):
+        batch = FatgraphBatch.from_fatgraphs(GRAPHS)
+        assert list(batch) == GRAPHS
+        assert batch.to_fatgraphs(backend='array') == GRAPHS
+        assert batch[-1] == GRAPHS[-1]
+        with pytest.raises(IndexError):
+            batch[len(GRAPHS)]
+
+    def test_generated(self):
+        for valences, l in [((4,4,4), 0), ((2,3,3), 2), ((1,3,2), 0)]:
+            fgs = fggen.generateall(*valences, l=l)
+            batches = list(fggen.iter_batches(*valences, l=l, size=100))
+            assert [fg for b in batches for fg in b] == fgs
+            self.check(FatgraphBatch.from_fatgraphs(fgs), fgs)
+        batch, = fggen.iter_batches(3, 3, 2, genus=1, size=10**6)
+        assert set(batch.genus.tolist()) == {1}
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            FatgraphBatch.from_graphs([([(1,2)], [(1,3)])])
+        with pytest.raises(ValueError):
+            FatgraphBatch.from_graphs([([(1,2), (2,)], [])])
+        with pytest.raises(ValueError):
+            FatgraphBatch.from_graphs([([(1,2,3)], [(1,2), (2,3)])])
+
+    def test_corpus(self, tmp_path):
+        path = tmp_path / 'corpus.fgc'
+        write_corpus(path, [(str(k), (fg.vertices, fg.edges, [], ''))
+                            for k, fg in enumerate(GRAPHS)])
+        with Corpus(path) as corpus:
+            self.check(corpus.batch(), GRAPHS)
+            assert list(corpus.batch(['2', '0'])) == [GRAPHS[2], GRAPHS[0]]
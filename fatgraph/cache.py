@@ -0,0 +1,150 @@
+'''
+Persistent cache of fatgraph invariants, kept in an SQLite file and
+keyed by a hash of the vertices and edges. Entries record the
+INVARIANTS_VERSION they were computed with; bump it whenever
+invariants() changes and stale entries are ignored and can be purged
+with InvariantCache.invalidate().
+'''
+
+import hashlib
+import json
+import sqlite3
+import time
+
+INVARIANTS_VERSION = 1
+
+
+def contenthash(vertices, edges):
+    "Hex digest identifying a labelled graph by its vertices and edges."
+    key = repr((tuple(tuple(v) for v in vertices),
+                tuple(tuple(e) for e in edges)))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def invariants(fg):
+    '''
+    Dictionary of the invariants of fatgraph fg that InvariantCache
+    stores: genus, number of boundary components, sorted boundary
+    lengths, vertex valences and connectedness.
+    '''
+    boundaries = fg.boundaries
+    return {'genus': fg.genus,
+            'boundaries': len(boundaries),
+            'boundary_lengths': sorted(len(b) for b in boundaries),
+            'valences': [len(v) for v in fg.vertices],
+            'connected': fg.isconnected()}
+
+
+class InvariantCache(object):
+    '''
+    SQLite-backed cache of invariants(). At most maxentries graphs
+    are kept; when there are more, the least recently used ones are
+    evicted. Lookups never write: new entries and the times of hits
+    are buffered and written in one transaction every flushevery
+    operations and on close, which is also when entries are evicted.
+    '''
+
+    def __init__(self, path, maxentries=1000000, flushevery=1000):
+        self.maxentries = maxentries
+        self.flushevery = flushevery
+        self._db = sqlite3.connect(str(path), timeout=60)
+        self._db.execute('CREATE TABLE IF NOT EXISTS invariants ('
+                         'key TEXT PRIMARY KEY, version INTEGER, '
+                         'data TEXT, used REAL)')
+        self._db.commit()
+        self._added = {}
+        self._used = {}
+        self._operations = 0
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        self.flush()
+        return self._db.execute(
+            'SELECT COUNT(*) FROM invariants').fetchone()[0]
+
+    def get(self, key):
+        "Cached invariants for a contenthash, or None."
+        if key in self._added and \
+           self._added[key][0] == INVARIANTS_VERSION:
+            data = json.loads(self._added[key][1])
+            self._touch(key)
+            return data
+        found = self._db.execute(
+            'SELECT data FROM invariants WHERE key = ? AND version = ?',
+            (key, INVARIANTS_VERSION)).fetchone()
+        if found is None:
+            return None
+        self._touch(key)
+        return json.loads(found[0])
+
+    def put(self, key, data):
+        self._added[key] = (INVARIANTS_VERSION, json.dumps(data),
+                            time.time())
+        self._used.pop(key, None)
+        self._pending()
+
+    def flush(self):
+        "Write the buffered entries and times of use, then evict."
+        if not self._added and not self._used:
+            self._operations = 0
+            return
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO invariants VALUES (?, ?, ?, ?)',
+                ((key,) + value for key, value in self._added.items()))
+            self._db.executemany(
+                'UPDATE invariants SET used = ? WHERE key = ?',
+                ((used, key) for key, used in self._used.items()))
+            excess = self._db.execute(
+                'SELECT COUNT(*) FROM invariants').fetchone()[0] - \
+                self.maxentries
+            if excess > 0:
+                self._db.execute(
+                    'DELETE FROM invariants WHERE key IN (SELECT key FROM '
+                    'invariants ORDER BY used, rowid LIMIT ?)', (excess,))
+        self._added.clear()
+        self._used.clear()
+        self._operations = 0
+
+    def _touch(self, key):
+        if key in self._added:
+            self._added[key] = self._added[key][:2] + (time.time(),)
+        else:
+            self._used[key] = time.time()
+        self._pending()
+
+    def _pending(self):
+        self._operations += 1
+        if self._operations >= self.flushevery:
+            self.flush()
+
+    def lookup(self, fg):
+        "Invariants of fatgraph fg, computed and stored on a miss."
+        key = contenthash(fg.vertices, fg.edges)
+        data = self.get(key)
+        if data is None:
+            data = invariants(fg)
+            self.put(key, data)
+        return data
+
+    def invalidate(self, everything=False):
+        '''
+        Delete the entries computed with another INVARIANTS_VERSION,
+        or all entries if everything is true.
+        '''
+        self.flush()
+        if everything:
+            self._db.execute('DELETE FROM invariants')
+        else:
+            self._db.execute('DELETE FROM invariants WHERE version != ?',
+                             (INVARIANTS_VERSION,))
+        self._db.commit()
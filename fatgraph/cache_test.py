@@ -0,0 +1,60 @@
+from . import cache
+from .cache import InvariantCache, contenthash
+from .fatgraph import Fatgraph
+
+
+class TestInvariantCache(object):
+    def test_lookup(self, tmp_path):
+        fg = Fatgraph([(1,2,3),(4,5,6)], [(1,4), (2,5), (3,6)])
+        expected = {'genus': 1, 'boundaries': 1, 'boundary_lengths': [6],
+                    'valences': [3, 3], 'connected': True}
+        assert fg.invariants() == expected
+        with InvariantCache(tmp_path / 'c.db') as c:
+            assert fg.invariants(c) == expected
+            assert len(c) == 1
+            key = contenthash(fg.vertices, fg.edges)
+            c.put(key, {'genus': 7})
+            assert fg.invariants(c) == {'genus': 7}
+        with InvariantCache(tmp_path / 'c.db') as c:
+            assert c.get(key) == {'genus': 7}
+
+    def test_eviction(self, tmp_path):
+        with InvariantCache(tmp_path / 'c.db', maxentries=2) as c:
+            for k in range(4):
+                c.put(str(k), {'genus': k})
+            assert len(c) == 2
+            assert c.get('0') is None and c.get('3') == {'genus': 3}
+
+    def test_buffered(self, tmp_path):
+        path = tmp_path / 'c.db'
+        with InvariantCache(path, flushevery=4) as c:
+            c.put('a', {'genus': 0})
+            c.put('b', {'genus': 1})
+            assert c.get('a') == {'genus': 0}
+            with InvariantCache(path) as other:
+                assert other.get('a') is None
+            c.flush()
+            changes = c._db.total_changes
+            for _ in range(5):
+                assert c.get('b') == {'genus': 1}
+            # Hits are only written in batches, never per lookup.
+            assert c._db.total_changes == changes + 1
+        with InvariantCache(path) as c:
+            assert c.get('b') == {'genus': 1}
+
+    def test_invalidate(self, tmp_path, monkeypatch):
+        with InvariantCache(tmp_path / 'c.db') as c:
+            c.put('old', {'genus': 0})
+            monkeypatch.setattr(cache, 'INVARIANTS_VERSION',
+                                cache.INVARIANTS_VERSION + 1)
+            assert c.get('old') is None
+            c.put('new', {'genus': 1})
+            c.invalidate()
+            assert len(c) == 1
+            c.invalidate(everything=True)
+            assert len(c) == 0
+
+    def test_contenthash(self):
+        assert contenthash([[1,2]], [[1,2]]) == \
+            contenthash(((1,2),), ((1,2),))
+        assert contenthash([(1,2)], [(1,2)]) != contenthash([(1,2)], [])
@@ -0,0 +1,76 @@
+'''
+Irreducible characters of the symmetric group, used to count
+fatgraphs without enumerating them. Partitions are tuples in
+decreasing order, e.g. (3, 1, 1).
+'''
+
+from functools import lru_cache
+from math import factorial
+
+
+def partitions(n, largest=None):
+    "Yield the partitions of n with parts at most largest."
+    if largest is None:
+        largest = n
+    if n == 0:
+        yield ()
+        return
+    for first in range(min(n, largest), 0, -1):
+        for rest in partitions(n - first, first):
+            yield (first,) + rest
+
+
+def dimension(shape):
+    "Degree of the character of shape, by the hook length formula."
+    conjugate = [len([p for p in shape if p > j])
+                 for j in range(shape[0] if shape else 0)]
+    hooks = 1
+    for i, row in enumerate(shape):
+        for j in range(row):
+            hooks *= row - j + conjugate[j] - i - 1
+    return factorial(sum(shape)) // hooks
+
+
+@lru_cache(maxsize=None)
+def character(shape, cycletype):
+    '''
+    Value of the irreducible character of shape on a permutation of
+    cycletype, by the Murnaghan-Nakayama rule. cycletype must be
+    sorted in decreasing order; it is consumed from the front.
+    '''
+    if not cycletype or cycletype[0] == 1:
+        return dimension(shape)
+    r, rest = cycletype[0], cycletype[1:]
+    # Remove r-rim hooks using the beta-set of the shape: moving a bead
+    # from b to b - r removes a hook whose height is the number of
+    # beads passed over.
+    beta = [p + len(shape) - 1 - i for i, p in enumerate(shape)]
+    beads = set(beta)
+    total = 0
+    for b in beta:
+        if b - r < 0 or b - r in beads:
+            continue
+        height = len([c for c in beta if b - r < c < b])
+        newbeta = sorted((beads - {b}) | {b - r}, reverse=True)
+        newshape = tuple(p - (len(newbeta) - 1 - i)
+                         for i, p in enumerate(newbeta))
+        newshape = tuple(p for p in newshape if p > 0)
+        total += (-1)**height * character(newshape, rest)
+    return total
+
+
+def contentpolynomial(shape):
+    '''
+    Coefficients, lowest degree first, of the product of (x + j - i)
+    over the cells (i, j) of shape. Summed against characters this
+    counts permutations by their number of cycles.
+    '''
+    coefficients = [1]
+    for i, row in enumerate(shape):
+        for j in range(row):
+            content = j - i
+            shifted = [0] + coefficients
+            for k, c in enumerate(coefficients):
+                shifted[k] += content * c
+            coefficients = shifted
+    return coefficients
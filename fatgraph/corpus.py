@@ -0,0 +1,209 @@
+'''
+Packed on-disk corpus of fatgraphs. A corpus file holds the vertices,
+edges, interior edges and sequence of many proteins, the contents of
+the {name}.pkl files read by scripts/compute.py, as a few flat integer
+arrays. Corpus memory-maps the file, so opening it costs one read of
+the header and any entry can be reached in O(1) without unpickling.
+
+Layout: the 8 byte MAGIC, the header length as a little-endian
+uint64, a JSON header with the entry names and the offset, dtype and
+length of each array, then the arrays, each aligned to 8 bytes. Each
+of vertices, edges and interiors is a list of tuples per entry and is
+stored as three arrays:
+    {part}_entry  offsets of each entry's first tuple (length N+1)
+    {part}_start  offsets of each tuple's first half-edge
+    {part}_flat   the half-edges
+The sequences are stored as UTF-8 in sequence_flat with offsets in
+sequence_entry.
+'''
+
+import json
+import mmap
+import pathlib
+import pickle
+import struct
+from array import array
+
+import numpy as np
+
+from .batch import FatgraphBatch
+from .fatgraph import Fatgraph, FatgraphB
+
+MAGIC = b'FGCORP01'
+PARTS = ('vertices', 'edges', 'interiors')
+
+
+def write_corpus(path, entries):
+    '''
+    Write a corpus file. entries is an iterable of
+    (name, (vertices, edges, interiors, sequence)) pairs.
+    '''
+    names = []
+    arrays = {'sequence_entry': array('q', [0]),
+              'sequence_flat': bytearray()}
+    for part in PARTS:
+        arrays[part + '_entry'] = array('q', [0])
+        arrays[part + '_start'] = array('q', [0])
+        arrays[part + '_flat'] = array('i')
+    for name, entry in entries:
+        names.append(name)
+        for part, tuples in zip(PARTS, entry):
+            flat, start = arrays[part + '_flat'], arrays[part + '_start']
+            for t in tuples:
+                flat.extend(t)
+                start.append(len(flat))
+            arrays[part + '_entry'].append(len(start) - 1)
+        arrays['sequence_flat'].extend(str(entry[3]).encode())
+        arrays['sequence_entry'].append(len(arrays['sequence_flat']))
+
+    layout = {}
+    offset = 0
+    for key, data in arrays.items():
+        dtype = data.typecode if isinstance(data, array) else 'B'
+        itemsize = np.dtype(dtype).itemsize
+        layout[key] = [offset, dtype, len(data)]
+        offset += _aligned(len(data) * itemsize)
+    header = json.dumps({'names': names, 'arrays': layout}).encode()
+    with open(path, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<Q', len(header)))
+        fh.write(header)
+        fh.write(bytes(_aligned(fh.tell()) - fh.tell()))
+        for key, data in arrays.items():
+            raw = np.asarray(data, dtype=layout[key][1]).astype(
+                np.dtype(layout[key][1]).newbyteorder('<')).tobytes()
+            fh.write(raw)
+            fh.write(bytes(_aligned(len(raw)) - len(raw)))
+
+
+def convert_pickles(pkl_dir, path, pattern='*.pkl'):
+    '''
+    Write the {name}.pkl files of pkl_dir, in sorted order, to a
+    corpus file. Return the number of entries written.
+    '''
+    files = sorted(pathlib.Path(pkl_dir).glob(pattern))
+
+    def entries():
+        for f in files:
+            with open(f, 'rb') as fh:
+                yield f.stem, pickle.load(fh)
+
+    write_corpus(path, entries())
+    return len(files)
+
+
+def _aligned(n):
+    return (n + 7) // 8 * 8
+
+
+class Corpus(object):
+    '''
+    Read-only view of a corpus file. corpus[name] returns the
+    (vertices, edges, interiors, sequence) tuple stored for name, as
+    it was pickled; iterating over a corpus yields the names in file
+    order and items() the (name, entry) pairs.
+    '''
+
+    def __init__(self, path):
+        self._fh = open(path, 'rb')
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError('{} is not a fatgraph corpus'.format(path))
+        size, = struct.unpack_from('<Q', self._mm, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(self._mm[start:start + size].decode())
+        base = _aligned(start + size)
+        self.names = header['names']
+        self._index = {name: k for k, name in enumerate(self.names)}
+        self._arrays = {}
+        for key, (offset, dtype, length) in header['arrays'].items():
+            self._arrays[key] = np.frombuffer(
+                self._mm, dtype=np.dtype(dtype).newbyteorder('<'),
+                count=length, offset=base + offset)
+
+    def close(self):
+        self._arrays = {}
+        try:
+            self._mm.close()
+        except BufferError:
+            # Arrays returned by arrays() are still alive; the map is
+            # released together with them.
+            pass
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __getitem__(self, name):
+        k = self._index[name]
+        return tuple(self._tuples(part, k) for part in PARTS) + \
+            (self.sequence(name),)
+
+    def items(self):
+        for name in self.names:
+            yield name, self[name]
+
+    def arrays(self, name):
+        '''
+        Return {part: (start, flat)} for vertices, edges and
+        interiors of name, where flat holds the half-edges and tuple j
+        is flat[start[j]:start[j+1]]. flat is a view into the mapped
+        file; start is a copy of the stored offsets rebased to 0, one
+        item per tuple plus one.
+        '''
+        k = self._index[name]
+        return {part: self._part(part, k) for part in PARTS}
+
+    def sequence(self, name):
+        k = self._index[name]
+        entry = self._arrays['sequence_entry']
+        return self._arrays['sequence_flat'][entry[k]:entry[k+1]] \
+            .tobytes().decode()
+
+    def fatgraph(self, name, backend='permutation'):
+        arrays = self.arrays(name)
+        vstart, vflat = arrays['vertices']
+        estart, eflat = arrays['edges']
+        return Fatgraph.from_arrays(vstart, vflat, eflat, estart, backend)
+
+    def fatgraphB(self, name, backend='permutation'):
+        vertices, edges, interiors, _ = self[name]
+        return FatgraphB(vertices, edges, interiors, backend)
+
+    def batch(self, names=None):
+        '''
+        FatgraphBatch of the fatgraphs of names, default all entries in
+        file order. The whole corpus is read straight from the arrays.
+        '''
+        if names is None:
+            a = self._arrays
+            return FatgraphBatch.from_csr(
+                *(a[part + suffix] for part in ('vertices', 'edges')
+                  for suffix in ('_entry', '_start', '_flat')))
+        return FatgraphBatch.from_graphs(self[name][:2] for name in names)
+
+    def _part(self, part, k):
+        "(start, flat) of part of entry k, see arrays."
+        entry = self._arrays[part + '_entry']
+        start = self._arrays[part + '_start'][entry[k]:entry[k+1] + 1]
+        return (start - start[0],
+                self._arrays[part + '_flat'][start[0]:start[-1]])
+
+    def _tuples(self, part, k):
+        start, flat = self._part(part, k)
+        flat = flat.tolist()
+        start = start.tolist()
+        return [tuple(flat[i:j]) for i, j in zip(start, start[1:])]
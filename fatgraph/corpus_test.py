@@ -0,0 +1,50 @@
+import pickle
+import pytest
+import numpy as np
+from .fatgraph import Fatgraph, FatgraphB
+from .corpus import Corpus, convert_pickles, write_corpus
+
+ENTRIES = [
+    ('1abcA', ([(1,2,3,4,5,6)], [(2,3), (5,6)],
+               [(1,6), (2,5), (3,4)], 'MKVL')),
+    ('2xyzB', ([(1,2,3,4), (5,6)], [(3,4), (2,5)],
+               [(1,4), (2,3), (5,6)], 'GAVLIÅ')),
+    ('3empA', ([], [], [], '')),
+]
+
+
+class TestCorpus(object):
+    def test_roundtrip(self, tmp_path):
+        path = tmp_path / 'corpus.fgc'
+        write_corpus(path, ENTRIES)
+        with Corpus(path) as corpus:
+            assert len(corpus) == 3
+            assert list(corpus) == [name for name, _ in ENTRIES]
+            assert '2xyzB' in corpus and 'none' not in corpus
+            for name, entry in ENTRIES:
+                assert corpus[name] == entry
+            assert list(corpus.items()) == ENTRIES
+            assert corpus.fatgraph('2xyzB') == \
+                Fatgraph(*ENTRIES[1][1][:2])
+            assert corpus.fatgraphB('1abcA') == \
+                FatgraphB(*ENTRIES[0][1][:3])
+            start, flat = corpus.arrays('2xyzB')['vertices']
+            assert list(start) == [0, 4, 6]
+            assert list(flat) == [1, 2, 3, 4, 5, 6]
+            with pytest.raises(KeyError):
+                corpus['none']
+
+    def test_convert_pickles(self, tmp_path):
+        for name, entry in ENTRIES:
+            with open(tmp_path / '{}.pkl'.format(name), 'wb') as fh:
+                pickle.dump(entry, fh)
+        path = tmp_path / 'corpus.fgc'
+        assert convert_pickles(tmp_path, path) == 3
+        with Corpus(path) as corpus:
+            assert list(corpus.items()) == ENTRIES
+
+    def test_not_a_corpus(self, tmp_path):
+        path = tmp_path / 'bad'
+        path.write_bytes(b'0' * 64)
+        with pytest.raises(ValueError):
+            Corpus(path)
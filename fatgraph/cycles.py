@@ -0,0 +1,137 @@
+import random
+
+
+class Cycles(object):
+    '''
+    The cycles of a permutation of 0, 1, ..., n-1 that is multiplied
+    by one transposition after another, as phi = sigma*eps is when an
+    edge is added or removed. Each cycle is kept as a sequence in a
+    treap, in the order the permutation visits it, so finding whether
+    two points are on the same cycle and splitting or joining cycles
+    take O(log n) expected time instead of a walk along the cycles.
+    ncycles holds the current number of cycles, fixed points included.
+    '''
+
+    __slots__ = ('left', 'right', 'parent', 'size', 'priority',
+                 'ncycles')
+
+    def __init__(self, image, seed=0):
+        n = len(image)
+        rng = random.Random(seed)
+        self.left = [-1] * n
+        self.right = [-1] * n
+        self.parent = [-1] * n
+        self.size = [1] * n
+        self.priority = [rng.random() for _ in range(n)]
+        self.ncycles = 0
+        seen = [False] * n
+        for i in range(n):
+            if seen[i]:
+                continue
+            root = -1
+            j = i
+            while not seen[j]:
+                seen[j] = True
+                root = self._merge(root, j)
+                j = image[j]
+            self.ncycles += 1
+
+    def same(self, i, j):
+        "Return True if i and j are on the same cycle."
+        return self._root(i) == self._root(j)
+
+    def transpose(self, a, b):
+        '''
+        Replace the permutation p by p*(a b), which maps a to p(b) and
+        b to p(a). This splits the cycle through a and b in two, or
+        joins the cycles through them into one. Return the change in
+        the number of cycles.
+        '''
+        if a == b:
+            return 0
+        root = self._rotate(a)
+        if self._root(b) == root:
+            # [x ... b y ... a] becomes [x ... b] and [y ... a]
+            self._split(root, self._index(b) + 1)
+            self.ncycles += 1
+            return 1
+        # [x ... a] and [y ... b] become [x ... a y ... b]
+        self._merge(root, self._rotate(b))
+        self.ncycles -= 1
+        return -1
+
+    def _root(self, i):
+        parent = self.parent
+        while parent[i] >= 0:
+            i = parent[i]
+        return i
+
+    def _index(self, i):
+        "Position of i in its sequence."
+        left, parent, size = self.left, self.parent, self.size
+        k = size[left[i]] if left[i] >= 0 else 0
+        while parent[i] >= 0:
+            p = parent[i]
+            if self.right[p] == i:
+                k += 1 + (size[left[p]] if left[p] >= 0 else 0)
+            i = p
+        return k
+
+    def _rotate(self, i):
+        "Rotate the sequence of i to end with i and return its root."
+        first, rest = self._split(self._root(i), self._index(i) + 1)
+        return self._merge(rest, first)
+
+    def _update(self, i):
+        size = 1
+        for c in (self.left[i], self.right[i]):
+            if c >= 0:
+                size += self.size[c]
+                self.parent[c] = i
+        self.size[i] = size
+
+    def _merge(self, a, b):
+        "Concatenate the sequences with roots a and b; return the root."
+        root = self._join(a, b)
+        if root >= 0:
+            self.parent[root] = -1
+        return root
+
+    def _join(self, a, b):
+        if a < 0:
+            return b
+        if b < 0:
+            return a
+        if self.priority[a] > self.priority[b]:
+            self.right[a] = self._join(self.right[a], b)
+            self._update(a)
+            return a
+        self.left[b] = self._join(a, self.left[b])
+        self._update(b)
+        return b
+
+    def _split(self, root, k):
+        '''
+        Split the sequence with the given root after its first k
+        points; return the roots of the two parts, -1 for an empty one.
+        '''
+        first, rest = self._cut(root, k)
+        for r in (first, rest):
+            if r >= 0:
+                self.parent[r] = -1
+        return first, rest
+
+    def _cut(self, t, k):
+        if t < 0:
+            return -1, -1
+        left = self.left[t]
+        leftsize = self.size[left] if left >= 0 else 0
+        if k <= leftsize:
+            first, rest = self._cut(left, k)
+            self.left[t] = rest
+            self._update(t)
+            return first, t
+        first, rest = self._cut(self.right[t], k - leftsize - 1)
+        self.right[t] = first
+        self._update(t)
+        return t, rest
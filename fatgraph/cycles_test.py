@@ -0,0 +1,28 @@
+import random
+from permutation import Permutation
+from .cycles import Cycles
+
+
+class TestCycles(object):
+    def test_transpose(self):
+        rng = random.Random(0)
+        for n in (1, 2, 5, 30):
+            image = list(range(n))
+            rng.shuffle(image)
+            cycles = Cycles(image)
+            p = Permutation(*(i + 1 for i in image))
+            assert cycles.ncycles == len(p.to_cycles()) + \
+                n - len([i for c in p.to_cycles() for i in c])
+            for _ in range(50):
+                a, b = rng.randrange(n), rng.randrange(n)
+                before = cycles.ncycles
+                change = cycles.transpose(a, b)
+                if a != b:
+                    p = p * Permutation.cycle(a + 1, b + 1)
+                expected = len(p.to_cycles()) + n - \
+                    len([i for c in p.to_cycles() for i in c])
+                assert cycles.ncycles == expected == before + change
+                c = rng.randrange(n)
+                assert cycles.same(a, c) == any(
+                    a + 1 in cyc and c + 1 in cyc for cyc in p.to_cycles()) \
+                    or (a == c)
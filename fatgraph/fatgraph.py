@@ -1,13 +1,152 @@
+import functools
+import mmap
+import os
+import pathlib
 import re
-from itertools import accumulate
+import time
+import weakref
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, groupby, islice
+from math import factorial
 from operator import mul
 from permutation import Permutation
 
 import numpy as np
 
+from .arrayperm import ArrayPermutation
+from . import instrument
+from .cache import invariants
+from .cycles import Cycles
+from .unionfind import UnionFind
+
 DONOR_COL = 12
 ACCPT_COL = 13
 FLAGS_COL = 21
+# Column identifying the chain or entry of a bond in Hbond files that
+# concatenate several chains
+ENTRY_COL = 0
+
+# We only consider intra-chain bonds (indicated by __), and the last
+# two characters of the flags must be either U (unique) or S (strong)
+HBOND_FLAGS = re.compile("__[US][US]$")
+
+# Permutation implementations a Fatgraph can be built on. 'array'
+# stores each permutation as a NumPy array indexed by half-edge and is
+# much faster for graphs with many half-edges.
+BACKENDS = {'permutation': Permutation,
+            'array': ArrayPermutation}
+
+
+class VertexSkeleton(object):
+    '''
+    The vertices of a fatgraph with everything that depends on them
+    alone: the vertex permutation and its cycles, the half-edges and
+    the half-edge to vertex index. Skeletons are immutable and
+    interned by get, so every graph on the same vertices and backend,
+    e.g. every graph of an enumeration in fggen, shares one and these
+    are only computed once.
+    A skeleton also packs the edges of a graph on it into bytes, one
+    array item per half-edge holding its position in halfedges, see
+    pack, which is how Fatgraph stores them.
+    '''
+
+    __slots__ = ('vertices', 'backend', 'halfedges', 'position',
+                 'nvertices', 'perm', 'typecode', '_vertexindex', '_cycles',
+                 '__weakref__')
+
+    _interned = weakref.WeakValueDictionary()
+
+    def __init__(self, vertices, backend='permutation', perm=None):
+        self.vertices = tuple(tuple(v) for v in vertices)
+        self.backend = backend
+        self.halfedges = tuple(h for v in self.vertices for h in v)
+        self.position = {h: k for k, h in enumerate(self.halfedges)}
+        self.nvertices = len([v for v in self.vertices if len(v) > 1])
+        self.perm = _fromcycles(backend, self.vertices) if perm is None \
+            else perm
+        n = len(self.halfedges)
+        self.typecode = 'B' if n <= 1 << 8 else 'H' if n <= 1 << 16 else 'I'
+        self._vertexindex = None
+        self._cycles = None
+
+    def __reduce__(self):
+        return type(self).get, (self.vertices, self.backend)
+
+    @property
+    def vertexindex(self):
+        "Dictionary mapping each half-edge to the index of its vertex."
+        if self._vertexindex is None:
+            self._vertexindex = {h: k for k, v in enumerate(self.vertices)
+                                 for h in v}
+        return self._vertexindex
+
+    @property
+    def cycles(self):
+        "Non-trivial cycles of the vertex permutation."
+        if self._cycles is None:
+            self._cycles = tuple(self.perm.to_cycles())
+        return self._cycles
+
+    @classmethod
+    def get(cls, vertices, backend='permutation', validate=True,
+            perm=None):
+        '''
+        The shared skeleton of vertices with the given backend. If
+        validate is true, raise ValueError if a half-edge is repeated.
+        perm is the vertex permutation if it is already built, as in
+        Fatgraph.from_arrays; it is used only by a new skeleton.
+        '''
+        vertices = tuple(tuple(v) for v in vertices)
+        key = vertices, backend
+        skeleton = cls._interned.get(key)
+        if skeleton is None:
+            skeleton = cls._interned[key] = cls(vertices, backend, perm)
+        if validate and len(skeleton.position) != len(skeleton.halfedges):
+            raise ValueError('Vertices are not unique')
+        return skeleton
+
+    def unpaired(self, edges, validate=False):
+        '''
+        Return the half-edges that are on none of edges, and if
+        validate is true check that no half-edge is repeated and that
+        edges only use half-edges of this skeleton.
+        '''
+        es = set()
+        nes = 0
+        for e in edges:
+            es.update(e)
+            nes += len(e)
+        if validate:
+            if nes != len(es):
+                raise ValueError('Edges are not unique')
+            if not es <= self.position.keys():
+                raise ValueError('Edges do not connect to vertices')
+        return frozenset(self.position.keys() - es)
+
+    def pack(self, edges):
+        '''
+        Return edges as bytes, or None unless they are all pairs of
+        half-edges of this skeleton.
+        '''
+        flat = []
+        for e in edges:
+            if len(e) != 2:
+                return None
+            flat.extend(e)
+        try:
+            return array(self.typecode,
+                         [self.position[h] for h in flat]).tobytes()
+        except KeyError:
+            return None
+
+    def unpack(self, packed):
+        "Return the edges packed by pack."
+        halfedges = self.halfedges
+        ends = iter([halfedges[k]
+                     for k in memoryview(packed).cast(self.typecode)])
+        return tuple(zip(ends, ends))
 
 
 class Fatgraph(object):
@@ -18,18 +157,40 @@ class Fatgraph(object):
     a figure-of-eight fargraph on a single 4-valent vertex.
     Constructor takes two arguments, each an iterable of iterables,
     for example vertices=((1,2,3),(4,5,6)), edges=((1,2),(3,4)(5,6))
+    The optional backend argument selects the permutation
+    implementation, one of the keys of BACKENDS. validate=False skips
+    the checks of checkvalidity that no half-edge is repeated and that
+    edges only use half-edges of vertices, for callers that know their
+    input is valid.
+    The vertices are held by a VertexSkeleton shared with every other
+    graph on the same vertices, and edges that are all pairs are
+    packed by it, so a graph only owns its pairing until derived
+    values are cached.
     """
 
-    def __init__(self, vertices, edges):
+    __slots__ = ('_skeleton', '_edges', '_cache')
+
+    def __init__(self, vertices, edges, backend='permutation',
+                 validate=True):
+        self._attach(VertexSkeleton.get(vertices, backend, validate),
+                     edges, validate)
+
+    @classmethod
+    def from_skeleton(cls, skeleton, edges, validate=True):
+        "Create fatgraph with the given edges on a VertexSkeleton."
+        fg = cls.__new__(cls)
+        fg._attach(skeleton, edges, validate)
+        return fg
+
+    def _attach(self, skeleton, edges, validate):
+        edges = tuple(tuple(e) for e in edges)
         # Check the arguments define a valid fatgraph
-        self.checkvalidity(vertices, edges)
-        self.vertices = vertices
-        self.edges = edges
-        self._vs = Permutation.from_cycles(*vertices)
-        self._es = Permutation.from_cycles(*edges)
-        vs = [i for j in vertices for i in j]
-        es = [i for j in edges for i in j]
-        self.unpaired = set(vs) - set(es)
+        if validate:
+            skeleton.unpaired(edges, True)
+        packed = skeleton.pack(edges)
+        self._skeleton = skeleton
+        self._edges = edges if packed is None else packed
+        self._cache = None
 
     def __repr__(self):
         return ('{0.__module__}.{0.__name__}(\n'
@@ -46,53 +207,306 @@ class Fatgraph(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash(self.canonical_form())
+
+    # Vertices, edges and unpaired half-edges are read-only. The
+    # permutations can be replaced, which resets every cached value,
+    # or changed one edge at a time, see add_edge. The edge
+    # permutation and the unpaired half-edges are cached on first use.
+
+    @property
+    def backend(self):
+        return self._skeleton.backend
+
+    @property
+    def vertices(self):
+        return self._skeleton.vertices
+
+    @property
+    def edges(self):
+        if type(self._edges) is bytes:
+            return self._skeleton.unpack(self._edges)
+        return self._edges
+
+    @property
+    def unpaired(self):
+        return self._cached('unpaired',
+                            lambda: self._skeleton.unpaired(self.edges))
+
+    @property
+    def _vs(self):
+        return self._skeleton.perm
+
+    @_vs.setter
+    def _vs(self, perm):
+        fixed = [i for i in self.halfedges if perm(i) == i]
+        vertices = tuple(perm.to_cycles()) + tuple((i,) for i in fixed)
+        self._edges = self.edges
+        self._skeleton = VertexSkeleton.get(vertices, self.backend, False)
+        self._invalidate()
+
+    @property
+    def _es(self):
+        return self._cached('eperm',
+                            lambda: _fromcycles(self.backend, self.edges))
+
+    @_es.setter
+    def _es(self, perm):
+        self._edges = tuple(perm.to_cycles())
+        self._invalidate()
+
+    def _invalidate(self):
+        self._cache = None
+
+    def _cached(self, key, compute):
+        if self._cache is None:
+            self._cache = {}
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = compute()
+            return value
+
+    @property
+    def halfedges(self):
+        return list(self._skeleton.halfedges)
+
+    @property
+    def nvertices(self):
+        "Number of non-trivial cycles of the vertex permutation."
+        return self._skeleton.nvertices
+
+    @property
+    def nedges(self):
+        "Number of non-trivial cycles of the edge permutation."
+        return self._cached('nedges',
+                            lambda: len(self._es.to_cycles()))
+
+    @property
+    def nboundaries(self):
+        return len(self._cached('boundaries', self._boundaries))
+
     @property
     def boundaries(self):
+        return list(self._cached('boundaries', self._boundaries).values())
+
+    def _boundaries(self):
+        "Dictionary mapping the smallest half-edge of each boundary to it."
         bs = self._vs * self._es
         cycles = bs.to_cycles()
         # to_cycles omits one-vertex boundaries as identity, so
         # need to add them.
-        fixed = set(i for v in self._vs.to_cycles() for i in v) - \
+        fixed = set(i for v in self._skeleton.cycles for i in v) - \
             set(j for c in cycles for j in c)
         for f in fixed:
             cycles.append((f,))
-        return cycles
+        return {min(c): c for c in cycles}
 
     @property
     def genus(self):
-        if len(self._vs.to_cycles()) == 0:
+        return self._cached('genus', self._genus)
+
+    def _genus(self):
+        if self.nvertices == 0:
             return 0
         else:
-            return int((2 - len(self._vs.to_cycles())
-                        + len(self._es.to_cycles())
-                        - len(self.boundaries)) / 2)
+            return int((2 - self.nvertices
+                        + self.nedges
+                        - self.nboundaries) / 2)
+
+    # Edge operations. They change the graph in place and, instead of
+    # recomputing every boundary from the permutations, only rebuild
+    # the boundaries through the half-edges involved, so nboundaries
+    # and genus stay current at the cost of walking those boundaries.
+
+    def add_edge(self, a, b):
+        "Pair the unpaired half-edges a and b."
+        unpaired = self.unpaired
+        if a == b or a not in unpaired or b not in unpaired:
+            raise ValueError('Edges must join two unpaired half-edges')
+        nedges = self.nedges
+        self._transpose(a, b)
+        self._edges = self.edges + ((a, b),)
+        self._update(nedges=nedges + 1, unpaired=unpaired - {a, b})
+
+    def remove_edge(self, a, b):
+        "Remove the edge between half-edges a and b, leaving them unpaired."
+        edges = self.edges
+        k = self._edgeindex(a, b, edges)
+        unpaired, nedges = self.unpaired, self.nedges
+        self._transpose(a, b)
+        self._edges = edges[:k] + edges[k+1:]
+        self._update(nedges=nedges - 1, unpaired=unpaired | {a, b})
+
+    def swap_endpoints(self, a, c):
+        '''
+        Exchange the partners of half-edges a and c, so edges (a, b)
+        and (c, d) become (a, d) and (c, b). If c is unpaired, the end
+        of edge (a, b) moves from a to c, and the other way round.
+        '''
+        b = self._partner(a)
+        d = self._partner(c)
+        if a == c or b == c:
+            return
+        if b is not None:
+            self.remove_edge(a, b)
+        if d is not None:
+            self.remove_edge(c, d)
+            self.add_edge(a, d)
+        if b is not None:
+            self.add_edge(c, b)
+
+    def contract_edge(self, a, b):
+        '''
+        Contract the edge between half-edges a and b, which must be on
+        different vertices. The two vertices are merged into one, in
+        place of the first, with the half-edges following a in their
+        cyclic order followed by those following b; a and b are
+        removed.
+        '''
+        edges = self.edges
+        k = self._edgeindex(a, b, edges)
+        unpaired, nedges = self.unpaired, self.nedges
+        vertexindex = self.vertexindex
+        i, j = vertexindex[a], vertexindex[b]
+        if i == j:
+            raise ValueError('Cannot contract a loop')
+        u, v = self.vertices[i], self.vertices[j]
+        p, q = u.index(a), v.index(b)
+        merged = u[p+1:] + u[:p] + v[q+1:] + v[:q]
+        first, second = sorted((i, j))
+        vertices = list(self.vertices)
+        vertices[first] = merged
+        del vertices[second]
+        if not merged:
+            del vertices[first]
+
+        # phi = sigma*eps simply skips a and b after the contraction.
+        phi, cycleof = self._phi()
+        boundaries = self._cache['boundaries']
+        members = set()
+        for h in (a, b):
+            if h in cycleof:
+                members.update(boundaries.pop(cycleof[h], ()))
+        for h in (a, b):
+            before = h
+            while phi[before] != h:
+                before = phi[before]
+            phi[before] = phi[h]
+            del phi[h], cycleof[h]
+        members -= {a, b}
+        self._relink(members, lambda h: merged == (h,))
+
+        self._skeleton = VertexSkeleton.get(vertices, self.backend, False)
+        self._edges = edges[:k] + edges[k+1:]
+        self._update(nedges=nedges - 1, unpaired=unpaired)
+
+    def _edgeindex(self, a, b, edges):
+        for k, e in enumerate(edges):
+            if e == (a, b) or e == (b, a):
+                return k
+        raise ValueError('No edge between {} and {}'.format(a, b))
+
+    def _partner(self, h):
+        "The half-edge paired with h, or None if h is unpaired."
+        if h in self.unpaired:
+            return None
+        for e in self.edges:
+            if len(e) == 2 and h in e:
+                return e[1] if e[0] == h else e[0]
+        raise ValueError('{} is not a half-edge'.format(h))
+
+    def _phi(self):
+        '''
+        The boundary permutation phi = sigma*eps as a dictionary, and
+        the dictionary mapping every half-edge on a boundary to the key
+        of that boundary in the boundaries cache. Half-edges missing
+        from phi are fixed.
+        '''
+        def compute():
+            phi, cycleof = {}, {}
+            for key, c in self._cached('boundaries',
+                                       self._boundaries).items():
+                for h, k in zip(c, c[1:] + c[:1]):
+                    phi[h] = k
+                    cycleof[h] = key
+            return phi, cycleof
+        return self._cached('phi', compute)
+
+    def _transpose(self, a, b):
+        "Replace phi by phi*(a b), splitting or merging boundaries."
+        phi, cycleof = self._phi()
+        boundaries = self._cache['boundaries']
+        members = {a, b}
+        for h in (a, b):
+            if h in cycleof:
+                members.update(boundaries.pop(cycleof[h], ()))
+        phi[a], phi[b] = phi.get(b, b), phi.get(a, a)
+        vertexindex = self.vertexindex
+        self._relink(members,
+                     lambda h: len(self.vertices[vertexindex[h]]) == 1)
+
+    def _relink(self, members, alone):
+        '''
+        Add the boundaries through the half-edges members after phi
+        changed. A fixed point h of phi is left out, like in
+        _boundaries, when alone(h) says it is the only half-edge of its
+        vertex.
+        '''
+        phi, cycleof = self._phi()
+        boundaries = self._cache['boundaries']
+        seen = set()
+        for h in members:
+            if h in seen:
+                continue
+            cycle = [h]
+            while phi.get(cycle[-1], cycle[-1]) != h:
+                cycle.append(phi[cycle[-1]])
+            seen.update(cycle)
+            if len(cycle) == 1 and alone(h):
+                phi.pop(h, None)
+                cycleof.pop(h, None)
+                continue
+            start = cycle.index(min(cycle))
+            cycle = tuple(cycle[start:] + cycle[:start])
+            for k, l in zip(cycle, cycle[1:] + cycle[:1]):
+                phi[k] = l
+                cycleof[k] = cycle[0]
+            boundaries[cycle[0]] = cycle
+
+    def _update(self, **values):
+        '''
+        Drop the cached values an edge operation invalidates, keeping
+        the boundaries and setting the given values.
+        '''
+        self._cache = {key: self._cache[key] for key in ('boundaries', 'phi')
+                       if key in self._cache}
+        self._cache.update(values)
 
     @classmethod
-    def from_hbonds(cls, hbfile, bbtype='alpha'):
+    def from_hbonds(cls, hbfile, bbtype='alpha', backend='permutation'):
         """
         Create fatgraph object from PDB Hbond file. The resulting
         fatgraph is simplified; that is, non-bonded half-edges are
         not recorded. Note this does not change genus.
         TODO: return non-simplified fatgraph
         """
-        bonds = []
         with open(hbfile, 'r') as fh:
-            for k, line in enumerate(fh):
-                cols = line.split()
-                # we only consider intra-chain bonds (indicated by __),
-                # and the last two characters must be either U (unique)
-                # or S (strong)
-                if not re.search("__[US][US]$", cols[FLAGS_COL]):
-                    continue
-                don = int(cols[DONOR_COL])
-                acc = int(cols[ACCPT_COL])
-                bonds.append((don, acc))
+            bonds = read_hbonds(fh)
+        return cls.from_bonds(bonds, bbtype, backend)
 
+    @classmethod
+    def from_bonds(cls, bonds, bbtype='alpha', backend='permutation'):
+        """
+        Create fatgraph object from a list of (donor, acceptor)
+        residue numbers, as returned by read_hbonds. See from_hbonds.
+        """
         try:
             dons, accs = zip(*bonds)
         except ValueError as e:
             if len(bonds) == 0:
-                return cls([()], [()])
+                return cls([()], [()], backend)
             else:
                 raise e
 
@@ -119,7 +533,9 @@ class Fatgraph(object):
             upper = sorted(upper)
             lower = sorted(lower, reverse=True)
             upper_dic = {v: k+1 for k, v in enumerate(upper)}
-            upper_max = upper_dic[upper[-1]]
+            # Position of the last upper half-edge, 0 if every bond is
+            # on the lower side.
+            upper_max = len(upper)
             lower_dic = {v: k+1+upper_max for k, v in enumerate(lower)}
             dons_dic, accs_dic = {}, {}
             for d in dons:
@@ -140,59 +556,502 @@ class Fatgraph(object):
 
         vertices = [list(range(1, len(dons_dic)+len(accs_dic)+1))]
 
-        return cls(vertices, edges)
+        return cls(vertices, edges, backend)
+
+    @classmethod
+    def from_hbonds_many(cls, paths, bbtype='alpha', backend='permutation',
+                         jobs=None, pattern='*', stats=None, errors='raise',
+                         chunk=16):
+        """
+        Yield (name, fatgraph) for every PDB Hbond file in paths, which
+        is either a directory, whose files matching pattern are read
+        in sorted order, or an iterable of files. name is the file name
+        without its suffix. Files are parsed by a pool of jobs worker
+        processes (default: one per CPU; jobs=1 parses in this
+        process) in chunks of chunk files, with at most two chunks per
+        worker pending, and yielded in order. errors says what to do
+        with a file that cannot be read or parsed (OSError or
+        ValueError): 'raise' raises the error once the files before
+        it are yielded, 'skip' leaves the file out and 'yield' yields
+        (name, error) in its place. If stats is a dictionary it is
+        kept updated with the number of files and lines read, the
+        number of files that failed, the elapsed seconds and the
+        throughput in files_per_second and lines_per_second.
+        """
+        if errors not in ('raise', 'skip', 'yield'):
+            raise ValueError('Unknown errors policy {!r}'.format(errors))
+        if isinstance(paths, (str, pathlib.Path)):
+            paths = sorted(p for p in pathlib.Path(paths).glob(pattern)
+                           if p.is_file())
+        work = functools.partial(_load_hbonds, cls, bbtype, backend)
+        if stats is None:
+            stats = {}
+        stats.update(files=0, lines=0, failed=0)
+        start = time.perf_counter()
+
+        def results(loaded):
+            for name, fg, nlines in loaded:
+                seconds = time.perf_counter() - start
+                stats['files'] += 1
+                stats['lines'] += nlines
+                stats.update(seconds=seconds,
+                             files_per_second=stats['files'] / seconds,
+                             lines_per_second=stats['lines'] / seconds)
+                if isinstance(fg, Exception):
+                    stats['failed'] += 1
+                    if errors == 'raise':
+                        raise fg
+                    if errors == 'skip':
+                        continue
+                yield name, fg
+
+        if jobs == 1:
+            yield from results(map(work, paths))
+        else:
+            chunkwork = functools.partial(_load_hbonds_chunk, work)
+            window = 2 * (jobs or os.cpu_count() or 1)
+            with ProcessPoolExecutor(jobs) as executor:
+                for loaded in _bounded_map(executor, chunkwork,
+                                           _chunks(paths, chunk), window):
+                    yield from results(loaded)
+
+    @classmethod
+    def from_hbonds_chains(cls, hbfile, bbtype='alpha', keycol=ENTRY_COL,
+                           backend='permutation'):
+        """
+        Yield (key, fatgraph) for every chain in a PDB Hbond file that
+        concatenates several chains, where key is the value of column
+        keycol. The lines of each chain must be consecutive: ValueError
+        is raised when a key reappears after other chains, and for a
+        line too short to hold the key and flags columns. Blank lines
+        are skipped. The file is memory-mapped and read once, holding
+        only one chain at a time.
+        """
+        maxcol = max(keycol, FLAGS_COL)
+        match = HBOND_FLAGS.search
+        with open(hbfile, 'rb') as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                seen = set()
+                name, bonds = None, []
+                for n, line in enumerate(iter(mm.readline, b''), 1):
+                    cols = line.decode().split(None, maxcol + 1)
+                    if not cols:
+                        continue
+                    if len(cols) <= maxcol:
+                        raise ValueError('Line {} of {} is too short'.format(
+                            n, hbfile))
+                    if cols[keycol] != name:
+                        if name is not None:
+                            yield name, cls.from_bonds(bonds, bbtype,
+                                                       backend)
+                        name, bonds = cols[keycol], []
+                        if name in seen:
+                            raise ValueError(
+                                'Chain {} continues at line {} of {} after '
+                                'other chains'.format(name, n, hbfile))
+                        seen.add(name)
+                    if match(cols[FLAGS_COL]):
+                        bonds.append((int(cols[DONOR_COL]),
+                                      int(cols[ACCPT_COL])))
+                if name is not None:
+                    yield name, cls.from_bonds(bonds, bbtype, backend)
+
+    @classmethod
+    def from_arrays(cls, vstart, vflat, eflat, estart=None,
+                    backend='permutation', validate=True):
+        """
+        Create fatgraph from NumPy arrays of half-edges, in the layout
+        returned by corpus.Corpus.arrays: vertex j holds the half-edges
+        vflat[vstart[j]:vstart[j+1]], and likewise for the edges. If
+        estart is None the edges are pairs, given as an (m, 2) array or
+        flat. Validation is done with array operations, the vertex
+        permutation is built from the arrays and edges that are all
+        pairs are packed from them, see VertexSkeleton.pack.
+        """
+        vstart, vflat = np.asarray(vstart), np.asarray(vflat)
+        eflat = np.asarray(eflat).reshape(-1)
+        if estart is None:
+            estart = np.arange(0, len(eflat) + 1, 2)
+        estart = np.asarray(estart)
+        if validate:
+            for start, flat in ((vstart, vflat), (estart, eflat)):
+                if len(start) == 0 or start[0] != 0 or \
+                   start[-1] != len(flat) or (np.diff(start) < 0).any():
+                    raise ValueError('Offsets do not cover the half-edges')
+            if len(np.unique(vflat)) != len(vflat):
+                raise ValueError('Vertices are not unique')
+            if len(np.unique(eflat)) != len(eflat):
+                raise ValueError('Edges are not unique')
+            if not np.isin(eflat, vflat).all():
+                raise ValueError('Edges do not connect to vertices')
+        if len(vflat) and vflat.min() < 1:
+            raise ValueError('Half-edges must be positive')
+        flat, start = vflat.tolist(), vstart.tolist()
+        vertices = tuple(tuple(flat[i:j]) for i, j in zip(start, start[1:]))
+        skeleton = VertexSkeleton.get(vertices, backend, False,
+                                      _arrayperm(backend, vstart, vflat))
+        fg = cls.__new__(cls)
+        fg._skeleton = skeleton
+        fg._cache = None
+        if (np.diff(estart) == 2).all():
+            position = np.zeros(int(vflat.max(initial=0)) + 1, dtype=int)
+            position[vflat] = np.arange(len(vflat))
+            fg._edges = position[eflat].astype(skeleton.typecode).tobytes()
+        else:
+            flat, start = eflat.tolist(), estart.tolist()
+            fg._edges = tuple(tuple(flat[i:j])
+                              for i, j in zip(start, start[1:]))
+        return fg
+
+    @classmethod
+    def genus_profile(cls, hbfile, window=None, step=1, bbtype='alpha'):
+        """
+        Genus along the backbone of the chain in a PDB Hbond file, see
+        profile_bonds.
+        """
+        with open(hbfile, 'r') as fh:
+            bonds = read_hbonds(fh)
+        return cls.profile_bonds(bonds, window, step, bbtype)
+
+    @classmethod
+    def profile_bonds(cls, bonds, window=None, step=1, bbtype='alpha'):
+        """
+        Return an integer array with a row (residue, genus, boundaries)
+        for every window of window consecutive residues, starting at
+        every step'th residue from the first residue in bonds, or if
+        window is None for every prefix of the chain, ending at every
+        step'th residue. residue is the first residue of the window or
+        the last one of the prefix. Each row agrees with from_bonds
+        applied to the bonds with both residues in the window or
+        prefix, with boundaries 0 when there are none. Like from_bonds
+        it raises ValueError if a residue donates or accepts several
+        bonds, as their edges would share a half-edge.
+        Each bond is added once and removed once as the window moves,
+        updating the boundary cycles with cycles.Cycles, so the whole
+        profile takes O(n log n) time for n bonds.
+        """
+        if not bonds:
+            return np.zeros((0, 3), dtype=int)
+        # Only the labels of the half-edges are needed from this.
+        full = cls.from_bonds(bonds, bbtype, 'array')
+        first = min(min(b) for b in bonds)
+        last = max(max(b) for b in bonds)
+        if window is None:
+            positions = range(first, last + 1, step)
+        else:
+            positions = range(first, max(last - window + 1, first) + 1,
+                              step)
+        # One vertex holding every half-edge of the chain, whose
+        # unpaired half-edges change neither genus nor boundaries.
+        # Adding or removing edge (a, b) multiplies phi by (a b).
+        (vertex,) = full.vertices
+        position = {h: k for k, h in enumerate(vertex)}
+        phi = Cycles([(k + 1) % len(vertex) for k in range(len(vertex))])
+        entering = sorted(range(len(bonds)), key=lambda k: max(bonds[k]))
+        leaving = sorted(range(len(bonds)), key=lambda k: min(bonds[k]))
+        added, removed = 0, 0
+        present = set()
+        rows = []
+        for p in positions:
+            lo, hi = (first, p) if window is None else (p, p + window - 1)
+            while removed < len(leaving) and \
+                    min(bonds[leaving[removed]]) < lo:
+                k = leaving[removed]
+                if k in present:
+                    present.remove(k)
+                    a, b = full.edges[k]
+                    phi.transpose(position[a], position[b])
+                removed += 1
+            while added < len(entering) and \
+                    max(bonds[entering[added]]) <= hi:
+                k = entering[added]
+                if min(bonds[k]) >= lo:
+                    present.add(k)
+                    a, b = full.edges[k]
+                    phi.transpose(position[a], position[b])
+                added += 1
+            if present:
+                genus = int((1 + len(present) - phi.ncycles) / 2)
+                rows.append((p, genus, phi.ncycles))
+            else:
+                rows.append((p, 0, 0))
+        return np.array(rows, dtype=int).reshape(-1, 3)
 
     @classmethod
     def checkvalidity(self, vertices, edges):
-        # Check supplied vertices and edges do not contain duplicates
-        vs = [i for j in vertices for i in j]
-        if len(vs) != len(set(vs)):
-            raise ValueError('Vertices are not unique')
-        es = [i for j in vertices for i in j]
-        if len(es) != len(set(es)):
-            raise ValueError('Edges are not unique')
-        # Check all half-edges are present in vertices
-        if not set(es) <= set(vs):
-            raise ValueError('Edges do not connect to vertices')
+        """
+        Raise ValueError unless every half-edge is on exactly one
+        vertex and on at most one edge.
+        """
+        VertexSkeleton.get(vertices, 'permutation', True).unpaired(edges,
+                                                                   True)
 
-    def isconnected(self):
+    @property
+    def vertexindex(self):
+        "Dictionary mapping each half-edge to the index of its vertex."
+        return self._skeleton.vertexindex
+
+    def _unionfind(self, vertexindex=None):
+        if vertexindex is None:
+            vertexindex = self.vertexindex
+        uf = UnionFind(len(self.vertices))
+        for e in self.edges:
+            if len(e) == 2:
+                uf.union(vertexindex[e[0]], vertexindex[e[1]])
+        return uf
+
+    def isconnected(self, vertexindex=None):
+        '''
+        Return True if this graph is connected. False otherwise.
+        vertexindex may be given to reuse the half-edge to vertex
+        index of another graph with the same vertices.
+        '''
+        return self._unionfind(vertexindex).ncomponents <= 1
+
+    def components(self):
+        '''
+        Return the connected components as a list of tuples of
+        vertices, ordered by their first vertex.
+        '''
+        uf = self._unionfind()
+        components = {}
+        for k, v in enumerate(self.vertices):
+            components.setdefault(uf.find(k), []).append(v)
+        return [tuple(c) for c in components.values()]
+
+    def invariants(self, cache=None):
+        '''
+        Return a dictionary with the genus, the number and lengths of
+        the boundaries, the valences and connectedness of this graph.
+        If cache is a cache.InvariantCache it is looked up there first
+        and stored there on a miss.
+        '''
+        if cache is None:
+            return invariants(self)
+        return cache.lookup(self)
+
+    def canonical_form(self):
         '''
-        Return True if this graph is connected. False otherwise
+        Return a hashable form that is equal for two graphs exactly
+        when they are isomorphic, i.e. related by relabelling the
+        half-edges in a way that preserves the cyclic order at every
+        vertex and the unpaired half-edges. It is the sorted tuple of
+        the lexicographically smallest traversal codes of the
+        components, see _traversal.
         '''
-        remaining = self.vertices.copy()
-        visited = {}
-        visit = [remaining[0], ]
-        remaining.remove(remaining[0])
+        return self._cached('canonical', self._canonical)[0]
+
+    @property
+    def automorphisms(self):
+        "Size of the automorphism group of this graph."
+        return self._cached('canonical', self._canonical)[1]
+
+    def canonical(self):
+        '''
+        Return the representative of the isomorphism class of this
+        graph whose half-edges are numbered in traversal order.
+        '''
+        vertices, edges = [], []
+        offset = 1
+        for code in self.canonical_form():
+            sigma, eps = code[0::2], code[1::2]
+            seen = set()
+            for h in range(len(sigma)):
+                if h not in seen:
+                    vertex = [h]
+                    while sigma[vertex[-1]] != h:
+                        vertex.append(sigma[vertex[-1]])
+                    seen.update(vertex)
+                    vertices.append(tuple(i + offset for i in vertex))
+                if h < eps[h]:
+                    edges.append((h + offset, eps[h] + offset))
+            offset += len(sigma)
+        return type(self)(vertices, edges, self.backend, validate=False)
+
+    def _canonical(self):
+        sigma = {h: k for v in self.vertices
+                 for h, k in zip(v, v[1:] + v[:1])}
+        eps = {h: h for h in sigma}
+        for e in self.edges:
+            if len(e) == 2:
+                eps[e[0]], eps[e[1]] = e[1], e[0]
+        codes = []
+        nauts = 1
+        remaining = set(sigma)
         while remaining:
-            # get all vertices connected to the first vertex in
-            # remaining list
-            tovisit = []
-            for v in visit:
-                for h in v:
-                    edge = [e for e in self.edges if h in e]
-                    if not edge:
-                        # h was an unpaired half-edge.
-                        continue
-                    edge = edge[0]
-                    if edge[0] == h:
-                        other = edge[1]
-                    else:
-                        other = edge[0]
-                    tv = [r for r in remaining if other in r]
-                    if len(tv) > 1:
-                        raise ValueError('Half-edges are not unique')
-                    tovisit.extend(tv)
-            if not tovisit:
-                # We've gone through all vertices in visit list,
-                # and there is no more to visit even though remaining
-                # list is not empty.
-                return False
-            visit = list(set(tovisit)) # de-duplicate
-            for v in visit:
-                remaining.remove(v)
+            _, component = self._traversal(min(remaining), sigma, eps)
+            # Every automorphism of a connected graph is determined by
+            # the image of a single half-edge, so the starts giving
+            # the smallest code are in bijection with automorphisms.
+            found = [self._traversal(h, sigma, eps)[0] for h in component]
+            code = min(found)
+            nauts *= found.count(code)
+            codes.append(code)
+            remaining.difference_update(component)
+        codes.sort()
+        # Isomorphic components can also be permuted among themselves.
+        for _, group in groupby(codes):
+            nauts *= factorial(len(list(group)))
+        return tuple(codes), nauts
 
-        # Nothing remaining. It is connected.
-        return True
+    @staticmethod
+    def _traversal(start, sigma, eps):
+        '''
+        Number the half-edges of the component of start in
+        breadth-first order, following the vertex rotation before the
+        edge. Return the code listing the numbers of sigma(h) and
+        eps(h) for each half-edge h in that order, and the order.
+        '''
+        label = {start: 0}
+        order = [start]
+        code = []
+        for h in order:
+            for k in (sigma[h], eps[h]):
+                if k not in label:
+                    label[k] = len(order)
+                    order.append(k)
+                code.append(label[k])
+        return tuple(code), order
+
+
+def _fromcycles(backend, cycles):
+    """
+    Permutation of the given backend with the given disjoint cycles,
+    built from its image in one pass.
+    """
+    points = [h for c in cycles for h in c]
+    if not points or min(points) < 1:
+        return BACKENDS[backend].from_cycles(*cycles)
+    image = list(range(max(points) + 1))
+    for c in cycles:
+        for h, k in zip(c, c[1:] + c[:1]):
+            image[h] = k
+    return _fromimage(backend, image)
+
+
+def _arrayperm(backend, start, flat):
+    '''
+    Permutation of the given backend whose cycles are the tuples
+    flat[start[j]:start[j+1]] of NumPy arrays.
+    '''
+    # Each half-edge maps to the next one of its tuple, the last one
+    # back to the first.
+    following = np.arange(1, len(flat) + 1)
+    first, last = start[:-1], start[1:] - 1
+    nonempty = last >= first
+    following[last[nonempty]] = first[nonempty]
+    image = np.arange(int(flat.max(initial=0)) + 1)
+    image[flat] = flat[following]
+    return _fromimage(backend, image if backend == 'array'
+                      else image.tolist())
+
+
+def _fromimage(backend, image):
+    "Permutation of the given backend mapping i to image[i], for i > 0."
+    if backend == 'array':
+        return ArrayPermutation(image)
+    return BACKENDS[backend](*image[1:])
+
+
+def filter_connected(fatgraphs):
+    '''
+    Yield the connected graphs from an iterable of Fatgraphs. The
+    half-edge to vertex index is only rebuilt when the vertices change
+    from one graph to the next, as they never do in the output of
+    fggen.generateall.
+    '''
+    vertices, vertexindex = None, None
+    for fg in fatgraphs:
+        if fg.vertices is not vertices and fg.vertices != vertices:
+            vertices, vertexindex = fg.vertices, fg.vertexindex
+        if fg.isconnected(vertexindex):
+            yield fg
+        elif instrument.enabled:
+            instrument.count('rejected_disconnected')
+
+
+def read_hbonds(lines):
+    '''
+    Return the (donor, acceptor) residue numbers of the bonds in the
+    lines of a PDB Hbond file that pass HBOND_FLAGS. Lines are only
+    split as far as the flags column.
+    '''
+    bonds = []
+    match = HBOND_FLAGS.search
+    for line in lines:
+        cols = line.split(None, FLAGS_COL + 1)
+        if match(cols[FLAGS_COL]):
+            bonds.append((int(cols[DONOR_COL]), int(cols[ACCPT_COL])))
+    return bonds
+
+
+def _load_hbonds(cls, bbtype, backend, path):
+    """
+    (name, fatgraph, lines) for the Hbond file path, with the error in
+    place of the fatgraph if it cannot be read or parsed, so that a
+    worker returns it instead of raising.
+    """
+    name = pathlib.Path(path).stem
+    try:
+        with open(path, 'r') as fh:
+            lines = fh.readlines()
+        fg = cls.from_bonds(read_hbonds(lines), bbtype, backend)
+    except (OSError, ValueError) as e:
+        return name, e, 0
+    return name, fg, len(lines)
+
+
+def _load_hbonds_chunk(work, paths):
+    return [work(path) for path in paths]
+
+
+def _chunks(iterable, size):
+    "Lists of size consecutive items of iterable, the last one shorter."
+    iterator = iter(iterable)
+    while True:
+        part = list(islice(iterator, size))
+        if not part:
+            return
+        yield part
+
+
+def _bounded_map(executor, func, iterable, window):
+    """
+    Like executor.map(func, iterable), but only submits the next item
+    when fewer than window calls are pending, so iterable is consumed
+    as the results are.
+    """
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _pmatpairs(mat, n=None):
+    '''
+    Number of strands and (i, j, mat[i,j]) for the nonzero entries of
+    a pairing matrix given as a dense array, a sparse matrix or an
+    iterable of (i, j) pairs; see FatgraphB.from_pmat.
+    '''
+    if isinstance(mat, np.ndarray):
+        rows, cols = np.nonzero(mat)
+        values = mat[rows, cols]
+        return len(mat), list(zip(rows.tolist(), cols.tolist(),
+                                  values.tolist()))
+    if hasattr(mat, 'tocoo'):
+        coo = mat.tocoo()
+        return coo.shape[0], [(i, j, x) for i, j, x in
+                              zip(coo.row.tolist(), coo.col.tolist(),
+                                  coo.data.tolist()) if x]
+    pairs = [(int(i), int(j), 1) for i, j in mat]
+    if n is None:
+        n = max((max(i, j) for i, j, _ in pairs), default=-1) + 1
+    return n, pairs
 
 
 class FatgraphB(Fatgraph):
@@ -205,9 +1064,12 @@ class FatgraphB(Fatgraph):
     unpaired half-edges.
     '''
 
-    def __init__(self, vertices, edges, interiors):
-        self._is = Permutation.from_cycles(*interiors)
-        super().__init__(vertices, edges)
+    __slots__ = ('_iperm',)
+
+    def __init__(self, vertices, edges, interiors, backend='permutation',
+                 validate=True):
+        self._iperm = _fromcycles(backend, interiors)
+        super().__init__(vertices, edges, backend, validate)
 
     def __repr__(self):
         return '\n'.join([super().__repr__(),
@@ -220,80 +1082,104 @@ class FatgraphB(Fatgraph):
     def __ne__(self, other):
         return not self == other
 
+    __hash__ = Fatgraph.__hash__
+
+    @property
+    def _is(self):
+        return self._iperm
+
+    @_is.setter
+    def _is(self, perm):
+        self._iperm = perm
+        self._invalidate()
+
     @property
     def interiors(self):
-        return self._is.to_cycles()
+        return list(self._cached('interiors',
+                                 lambda: tuple(self._is.to_cycles())))
 
     @classmethod
     def from_fatgraph(cls, fatgraph, interiors):
         assert isinstance(fatgraph, Fatgraph)
         return cls(fatgraph.vertices,
                    fatgraph.edges,
-                   interiors)
+                   interiors,
+                   fatgraph.backend,
+                   validate=False)
 
     @classmethod
-    def from_pmat(cls, mat):
+    def from_pmat(cls, mat, backend='permutation', n=None):
         "Make fatgraph from pairing matrix"
         '''
         [[0,0,0],     vertices: [(1,2,3,4,5,6),]
          [1,0,0], --> edges: [(2,3), (5,6)]
          [0,1,0]]     i_edges: [(1,6), (2,5), (3,4)]
+        mat is a dense NumPy array, a SciPy sparse matrix, or an
+        iterable of (i, j) strand pairs standing for the nonzero
+        entries mat[i,j], with n strands (default: the largest strand
+        plus one). Runs in time linear in the number of strands and
+        pairs, apart from reading a dense matrix.
         '''
+        n, pairs = _pmatpairs(mat, n)
+        # Neighbours of each strand in the symmetric matrix mat + mat.T
+        # and its row sums.
+        nbrs = [set() for _ in range(n)]
+        rowsums = [0] * n
+        for i, j, x in pairs:
+            nbrs[i].add(j)
+            nbrs[j].add(i)
+            rowsums[i] += x
+            rowsums[j] += x
+        if any(r > 2 for r in rowsums):
+            raise ValueError('Pairing matrix has bifurcation(s).')
+        nbrs = [sorted(nb) for nb in nbrs]
+        parallel = set((i, j) for i, j, x in pairs if i < j)
 
-        def findsheetat(k, mat):
+        def findsheetat(k):
             "Find sheet that starts with k'th strand"
             sheet = [k]
-            row = mat[k]
-            if np.count_nonzero(row) > 1:
+            if len(nbrs[k]) > 1:
                 raise ValueError('Sheet must start at an edge strand.')
-            elif np.count_nonzero(row) < 1:
+            elif len(nbrs[k]) < 1:
                 return sheet
+            seen = {k}
             prevk = k
-            thisk = np.flatnonzero(row)[0]
-            thisrow = mat[thisk]
-            while np.count_nonzero(thisrow) != 1:
-                if thisk in sheet:
+            thisk = nbrs[k][0]
+            while len(nbrs[thisk]) != 1:
+                if thisk in seen:
                     raise ValueError('Pairing matrix has barrel(s).')
                 sheet.append(thisk)
-                i, j = np.flatnonzero(thisrow)
+                seen.add(thisk)
+                i, j = nbrs[thisk]
                 if i == prevk:
                     nextk = j
                 else:
                     nextk = i
                 prevk, thisk = thisk, nextk
-                thisrow = mat[thisk]
             else:
-                if thisk in sheet:
+                if thisk in seen:
                     raise ValueError('Pairing matrix has barrel(s).')
                 sheet.append(thisk)
             return sheet
 
-        def findsheets(p_mat):
-            "Sheets from (symmetric) pairting matrix"
-            '''
-            findsheets([[0,0,1,0],
-                        [0,0,1,0],
-                        [1,1,0,0],
-                        [0,0,0,0]])
-            --> {(0,2,1),(3,)}
-            '''
-            wmat = np.copy(p_mat)
-            edges = [i for i in range(len(wmat))
-                     if np.count_nonzero(wmat[i])<2]
+        def findsheets():
+            "Sheets, each listed from its smaller edge strand"
+            edges = [i for i in range(n) if len(nbrs[i]) < 2]
             if not edges:
                 raise ValueError('Pairing matrix has no edge strand.')
             sheets = set()
-            while edges:
-                e = edges.pop(0)
-                sheet = tuple(findsheetat(e, wmat))
+            done = set()
+            for e in edges:
+                if e in done:
+                    continue
+                sheet = tuple(findsheetat(e))
                 if sheet[0] > sheet[-1]:
                     sheet = sheet[::-1]
                 sheets.add(sheet)
-                if sheet[-1] in edges:
-                    edges.remove(sheet[-1])
+                done.add(sheet[-1])
             return sheets
 
-        def makevertices(sheets, p_mat):
+        def makevertices(sheets):
             "Vertices from sheets and pairing matrix."
             '''
             [[0,1,2]], [[0, 0, 0],
@@ -306,7 +1192,7 @@ class FatgraphB(Fatgraph):
                 for i, j in zip(sheet, sheet[1:]):
                     if i > j:
                         i, j = j, i
-                    if p_mat[i,j]:
+                    if (i, j) in parallel:
                         oseq.append(1)
                     else:
                         oseq.append(-1)
@@ -325,13 +1211,10 @@ class FatgraphB(Fatgraph):
                 vertices.append(vertex)
             return vertices
 
-        symmat = mat + mat.T
-        if np.where(np.sum(symmat, axis=1)>2)[0].size:
-            raise ValueError('Pairing matrix has bifurcation(s).')
-        sheets = findsheets(symmat)
-        if len(mat) != len([i for sheet in sheets for i in sheet]):
+        sheets = findsheets()
+        if n != sum(len(sheet) for sheet in sheets):
             raise ValueError('Pairing matrix has barrel(s).')
-        vertices = makevertices(sheets, mat)
+        vertices = makevertices(sheets)
         vdict = {}
         for vertex in vertices:
             #We want anti-clockwise ordering of half-edges on each vertex
@@ -340,13 +1223,10 @@ class FatgraphB(Fatgraph):
             for i in range(r, r+len(l)):
                 vdict[l[i - r]] = i + 1
 
-        #Now we find edges
-        halfedges = sorted([i for vertex in vertices
-                            for v in vertex
-                            for i in v])
+        #Now we find edges. Every strand is in exactly one sheet, so the
+        #sorted half-edges are 0, 1, 10, 11, 20, 21, ...
+        halfedges = [i for s in range(n) for i in (s*10, s*10+1)]
         edges = [(i, j) for i, j in zip(halfedges, halfedges[1:])]
-        #edges = [(halfedges[i], halfedges[i+1])
-        #         for i in range(1, len(halfedges)-2, 2)]
 
         #Translate vertices and edges according to vdict
         v = []
@@ -359,16 +1239,23 @@ class FatgraphB(Fatgraph):
         iedges = [e for vertex in vertices for e in vertex]
         for e in iedges:
             iv.append((vdict[e[0]], vdict[e[1]]))
+        ivset = set(iv)
 
         e = []
         for d in edges:
             edge = (vdict[d[0]], vdict[d[1]])
             if edge[0] > edge[1]:
                 edge = edge[::-1]
-            if edge not in iv:
+            if edge not in ivset:
                 e.append(edge)
 
-        return cls(v, e, iv)
+        return cls(v, e, iv, backend)
+
+    @classmethod
+    def from_pmats(cls, mats, backend='permutation'):
+        "Yield a fatgraph for each pairing matrix in mats, see from_pmat."
+        for mat in mats:
+            yield cls.from_pmat(mat, backend)
 
     def isvalid(self):
         '''
@@ -376,24 +1263,35 @@ class FatgraphB(Fatgraph):
         (i.e. all edges are traversed), when following the exterior
         and interior edges.
         '''
-        h_edges = [i for j in self.vertices for i in j]
-        edges = self.interiors + self.edges
-        marked = set(h_edges) - set([i for e in self.edges for i in e])
+        # Each half-edge is on at most one interior and one exterior
+        # edge, so the walk below is determined by the next unused
+        # edge at the current half-edge, interior edges first.
+        interior, exterior = {}, {}
+        for i, j in self.interiors:
+            interior[i], interior[j] = j, i
+        for e in self.edges:
+            if len(e) == 2:
+                exterior[e[0]], exterior[e[1]] = e[1], e[0]
+        # With marked points the walk starts at the first of them in
+        # the iteration order of this set, as it always has; this is
+        # not always the smallest, and which graphs are valid depends
+        # on it.
+        marked = set(self.halfedges) - set(h for e in self.edges for h in e)
         if len(marked)//2 == 0: # no marked points
             last = 1
         else:
-            last = list(marked)[0]
-        while edges:
-            e = [l for l in edges if last in l]
-            if e:
-                edge = e[0]
-                edges.remove(edge)
-                if edge[0] == last:
-                    last = edge[1]
-                else:
-                    last = edge[0]
+            last = next(iter(marked))
+        usedi, usede = set(), set()
+        for _ in range(len(self.interiors) + len(self.edges)):
+            if last in interior and last not in usedi:
+                nxt = interior[last]
+                usedi.update((last, nxt))
+            elif last in exterior and last not in usede:
+                nxt = exterior[last]
+                usede.update((last, nxt))
             else:
                 # No match for last, we have a loop or a path
                 return False
-        # We emptied the edges list. So we have a maximal loop.
+            last = nxt
+        # We used every edge. So we have a maximal loop.
         return True
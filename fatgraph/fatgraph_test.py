@@ -1,8 +1,13 @@
+import random
 import pytest
 from permutation import Permutation
 import numpy as np
 from .fatgraph import Fatgraph
 from .fatgraph import FatgraphB
+from .fatgraph import VertexSkeleton
+from .fatgraph import filter_connected
+from .fatgraph import read_hbonds
+from . import fggen
 
 class TestFatgraphB(object):
     def test_from_fatgraph(self):
@@ -81,6 +86,35 @@ class TestFatgraphB(object):
                       [(1,4), (2,3), (5,6)])
         assert FatgraphB.from_pmat(mat) == fg
 
+    def test_from_pmat_pairs(self):
+        mat = np.array([[0,0,0,0],
+                        [1,0,0,0],
+                        [0,1,0,1],
+                        [0,0,0,0]])
+        pairs = [(1,0), (2,1), (2,3)]
+        assert FatgraphB.from_pmat(pairs) == FatgraphB.from_pmat(mat)
+        mat = np.array([[0,0,0],
+                        [1,0,0],
+                        [0,0,0]])
+        assert FatgraphB.from_pmat([(1,0)], n=3) == \
+            FatgraphB.from_pmat(mat)
+        with pytest.raises(ValueError):
+            FatgraphB.from_pmat([(0,1), (1,2), (1,3)])
+
+    def test_from_pmat_sparse(self):
+        sparse = pytest.importorskip('scipy.sparse')
+        mat = np.array([[0,0,0],
+                        [1,0,0],
+                        [1,0,0]])
+        assert FatgraphB.from_pmat(sparse.csr_matrix(mat)) == \
+            FatgraphB.from_pmat(mat)
+
+    def test_from_pmats(self):
+        mats = [np.array([[0,0,0], [1,0,0], [0,1,0]]),
+                np.array([[0,0,0], [1,0,0], [0,0,0]])]
+        assert list(FatgraphB.from_pmats(mats)) == \
+            [FatgraphB.from_pmat(m) for m in mats]
+
 class TestFatgraph(object):
     def test_Fatgraph(self):
         g1 = Fatgraph([(1,2,3),], [(1,2),])
@@ -108,6 +142,60 @@ class TestFatgraph(object):
             assert Fatgraph([(1,2,3,4),], [(1,2), (2,3)])
             assert Fatgraph([(1,2,3),], [(1,2), (3,4)])
 
+    def test_checkvalidity(self):
+        with pytest.raises(ValueError):
+            Fatgraph([(1,2,3), (3,4)], [(1,2)])
+        with pytest.raises(ValueError):
+            Fatgraph([(1,2,3,4),], [(1,2), (2,3)])
+        with pytest.raises(ValueError):
+            Fatgraph([(1,2,3),], [(1,2), (3,4)])
+        for vertices, edges in [([(1,2,3), (3,4)], [(1,2)]),
+                                ([(1,), (1,)], []),
+                                ([(1,2,3,4),], [(1,2), (2,3)]),
+                                ([(1,2,3),], [(1,2), (3,4)])]:
+            with pytest.raises(ValueError):
+                Fatgraph.checkvalidity(vertices, edges)
+        Fatgraph.checkvalidity([(1,2,3), (4,)], [(1,4), (2,)])
+        fg = Fatgraph([(1,2,3),], [(1,2), (3,4)], validate=False)
+        assert fg.edges == ((1,2), (3,4))
+        assert Fatgraph([(1,2,3),], [(1,3)], validate=False) == \
+            Fatgraph([(1,2,3),], [(1,3)])
+
+    def test_from_arrays(self):
+        graphs = [([(1,2,3),(4,5,6)], [(1,4), (2,6), (3,5)]),
+                  ([(1,2,3,4),(5,6)], [(3,4), (2,5)]),
+                  ([(1,2,3),(4,)], [(1,2),]),
+                  ([], [])]
+        for vertices, edges in graphs:
+            vstart = np.cumsum([0] + [len(v) for v in vertices])
+            vflat = np.array([h for v in vertices for h in v], dtype=int)
+            eflat = np.array(edges, dtype=int).reshape(-1, 2)
+            for backend in ('permutation', 'array'):
+                fg = Fatgraph.from_arrays(vstart, vflat, eflat,
+                                          backend=backend)
+                expected = Fatgraph(vertices, edges)
+                assert fg == expected
+                assert fg.vertices == expected.vertices
+                assert fg.edges == expected.edges
+                assert fg.unpaired == expected.unpaired
+                assert fg.genus == expected.genus
+                # Packed from the arrays on the shared skeleton.
+                assert fg._edges == expected._edges
+                assert fg._skeleton is VertexSkeleton.get(vertices, backend)
+        fg = Fatgraph.from_arrays([0, 4], [1,2,3,4], [1,2,3,4], [0, 4])
+        assert fg.edges == ((1,2,3,4),)
+        with pytest.raises(ValueError):
+            Fatgraph.from_arrays([0, 3], [1,2,3], [1,2,2,3])
+        with pytest.raises(ValueError):
+            Fatgraph.from_arrays([0, 3], [1,2,3], [1,4])
+        # Half-edge 3 is on no vertex.
+        with pytest.raises(ValueError):
+            Fatgraph.from_arrays([0, 2], [1,2,3], [1,3])
+        for vstart, estart in [([1, 3], [0, 2]), ([0, 2, 1, 3], [0, 2]),
+                               ([], [0, 2]), ([0, 3], [0, 1])]:
+            with pytest.raises(ValueError):
+                Fatgraph.from_arrays(vstart, [1,2,3], [1,3], estart)
+
     def test_isconnected(self):
         fg = Fatgraph([(1,2), (3,4)], [(1,3), (2,4)])
         assert fg.isconnected()
@@ -123,3 +211,308 @@ class TestFatgraph(object):
         fg = Fatgraph([(1,2,3), (4,5,6), (7,8,9)],
                       [(1,3), (2,5), (6,4), (8,9)])
         assert not fg.isconnected()
+
+    def test_array_backend(self):
+        graphs = [([(1,2,3),(4,5,6)], [(1,4), (2,6), (3,5)]),
+                  ([(1,2,3),(4,5,6)], [(1,4), (2,5), (3,6)]),
+                  ([(1,2,3,4),(5,6)], [(3,4), (2,5)]),
+                  ([(1,2,3),], [(1,2),])]
+        for vertices, edges in graphs:
+            fp = Fatgraph(vertices, edges)
+            fa = Fatgraph(vertices, edges, backend='array')
+            assert fa == fp
+            assert fa.boundaries == fp.boundaries
+            assert fa.genus == fp.genus
+            assert fa.isconnected() == fp.isconnected()
+        assert Fatgraph([], [], backend='array').genus == 0
+        fgb = FatgraphB([(1,2,3,4), (5,6,7,8)],
+                        [(1,8), (2,7), (3,5), (4,6)],
+                        [(1,4), (2,3), (5,6), (7,8)],
+                        backend='array')
+        assert fgb.isvalid()
+        mat = np.array([[0,0,0],
+                        [1,0,0],
+                        [1,0,0]])
+        assert FatgraphB.from_pmat(mat, backend='array') == \
+            FatgraphB.from_pmat(mat)
+
+    def test_cached_invariants(self):
+        fg = Fatgraph([(1,2,3),(4,5,6)], [(1,4), (2,5), (3,6)])
+        assert fg.vertices == ((1,2,3), (4,5,6))
+        assert (fg.nvertices, fg.nedges, fg.nboundaries) == (2, 3, 1)
+        assert fg.genus == 1
+        assert fg.genus is fg.genus
+        with pytest.raises(AttributeError):
+            fg.vertices = [(1,2,3,4,5,6)]
+        with pytest.raises(AttributeError):
+            fg.name = 'g'
+        fg._es = Permutation.from_cycles((1,4), (2,6), (3,5))
+        assert fg.edges == ((1,4), (2,6), (3,5))
+        assert fg.nboundaries == 3
+        assert fg.genus == 0
+        fg._es = Permutation.from_cycles((1,4))
+        assert fg.unpaired == {2,3,5,6}
+        assert fg == Fatgraph([(1,2,3),(4,5,6)], [(1,4)])
+
+    def test_skeleton(self):
+        graphs = fggen.generateall(3, 3, l=2)
+        skeleton = graphs[0]._skeleton
+        assert all(fg._skeleton is skeleton for fg in graphs)
+        assert Fatgraph([[1,2,3], [4,5,6]], [])._skeleton is skeleton
+        assert Fatgraph([(1,2,3), (4,5,6)], [], 'array')._skeleton \
+            is not skeleton
+        assert skeleton.vertices == ((1,2,3), (4,5,6))
+        assert skeleton.nvertices == 2
+        for fg in graphs:
+            assert type(fg._edges) is bytes
+            assert fg == Fatgraph(fg.vertices, list(fg.edges))
+            assert skeleton.unpack(skeleton.pack(fg.edges)) == fg.edges
+        assert skeleton.pack([(1,2), (3,)]) is None
+        assert skeleton.pack([(1,7)]) is None
+        big = VertexSkeleton([tuple(range(1, 1001))])
+        edges = tuple((i, 1001 - i) for i in range(1, 501))
+        assert big.unpack(big.pack(edges)) == edges
+        with pytest.raises(ValueError):
+            VertexSkeleton.get([(1,2), (2,3)])
+        fg = Fatgraph.from_skeleton(skeleton, [(1,4), (2,6)])
+        assert fg.unpaired == {3, 5}
+        with pytest.raises(ValueError):
+            Fatgraph.from_skeleton(skeleton, [(1,7)])
+
+    def test_components(self):
+        fg = Fatgraph([(1,2,3), (4,5,6), (7,8,9)],
+                      [(1,3), (2,5), (6,4), (8,9)])
+        assert fg.components() == [((1,2,3), (4,5,6)), ((7,8,9),)]
+        fg = Fatgraph([(1,2), (3,4), (5,6)], [(1,5)])
+        assert fg.components() == [((1,2), (5,6)), ((3,4),)]
+        assert Fatgraph([], []).isconnected()
+
+    def test_filter_connected(self):
+        vertices = [(1,2), (3,4)]
+        graphs = [Fatgraph(vertices, [(1,3), (2,4)]),
+                  Fatgraph(vertices, [(1,2), (3,4)]),
+                  Fatgraph(vertices, [(1,4)]),
+                  Fatgraph([(1,2,3), (4,5,6)], [(1,2), (3,6)])]
+        connected = list(filter_connected(graphs))
+        assert connected == [graphs[0], graphs[2], graphs[3]]
+
+    def test_canonical_form(self):
+        g1 = Fatgraph([(1,2,3),(4,5,6)], [(1,4), (2,6), (3,5)])
+        g2 = Fatgraph([(4,6,5),(2,3,1)], [(5,1), (4,3), (6,2)])
+        g3 = Fatgraph([(1,2,3),(4,5,6)], [(1,4), (2,5), (3,6)])
+        assert g1.canonical_form() == g2.canonical_form()
+        assert g1.canonical_form() != g3.canonical_form()
+        assert hash(g1) == hash(g2)
+        assert len({g1, g2, g3}) == 3
+        assert g1.canonical() == g2.canonical()
+        assert g1.canonical().canonical_form() == g1.canonical_form()
+        assert g1.automorphisms == 6
+        assert g3.automorphisms == 6
+        g4 = Fatgraph([(1,2),(3,4),(5,6)], [(1,2), (3,4), (5,6)])
+        assert g4.automorphisms == 2**3 * 6
+        g5 = Fatgraph([(1,2,3),], [(1,2),])
+        assert g5.canonical_form() == \
+            Fatgraph([(1,2,3),], [(2,3),]).canonical_form()
+        assert g5.canonical_form() != \
+            Fatgraph([(1,2,3),], []).canonical_form()
+
+
+def recomputed(fg):
+    "Check fg against a Fatgraph built from scratch with its edges."
+    new = Fatgraph(fg.vertices, fg.edges)
+    assert fg == new
+    assert fg.unpaired == new.unpaired
+    assert fg.nvertices == new.nvertices
+    assert fg.nedges == new.nedges
+    assert fg.nboundaries == new.nboundaries
+    assert sorted(fg.boundaries) == sorted(new.boundaries)
+    assert fg.genus == new.genus
+
+
+class TestEdgeOperations(object):
+    def test_add_remove(self):
+        fg = Fatgraph([(1,2,3,4)], [])
+        assert fg.genus == 0 and fg.nboundaries == 1
+        fg.add_edge(1, 3)
+        recomputed(fg)
+        fg.add_edge(2, 4)
+        recomputed(fg)
+        assert fg.genus == 1
+        fg.remove_edge(3, 1)
+        recomputed(fg)
+        assert fg.edges == ((2, 4),)
+        with pytest.raises(ValueError):
+            fg.add_edge(2, 3)
+        with pytest.raises(ValueError):
+            fg.remove_edge(1, 3)
+
+    def test_contract(self):
+        fg = Fatgraph([(1,2,3), (4,5,6)], [(1,4), (2,6), (3,5)])
+        fg.contract_edge(1, 4)
+        assert fg.vertices == ((2, 3, 5, 6),)
+        recomputed(fg)
+        with pytest.raises(ValueError):
+            fg.contract_edge(2, 6)
+        fg = Fatgraph([(1,), (2,)], [(1,2)])
+        fg.contract_edge(1, 2)
+        assert fg.vertices == ()
+        recomputed(fg)
+
+    def test_swap(self):
+        fg = Fatgraph([(1,2,3,4,5)], [(1,2), (3,4)])
+        fg.swap_endpoints(2, 4)
+        assert set(fg.edges) == {(2,3), (4,1)}
+        recomputed(fg)
+        fg.swap_endpoints(3, 5)
+        assert set(fg.edges) == {(4,1), (5,2)}
+        recomputed(fg)
+
+    def test_random(self):
+        rng = random.Random(0)
+        for _ in range(100):
+            valences = [rng.randint(1, 4) for _ in range(rng.randint(1, 5))]
+            vertices = fggen.makevertices(*valences)
+            fg = Fatgraph(vertices, [])
+            for _ in range(20):
+                unpaired = sorted(fg.unpaired)
+                edges = [e for e in fg.edges if len(e) == 2]
+                op = rng.choice(['add', 'remove', 'swap', 'contract'])
+                if op == 'add' and len(unpaired) > 1:
+                    fg.add_edge(*rng.sample(unpaired, 2))
+                elif op == 'remove' and edges:
+                    fg.remove_edge(*rng.choice(edges))
+                elif op == 'swap' and len(fg.halfedges) > 1:
+                    fg.swap_endpoints(*rng.sample(fg.halfedges, 2))
+                elif op == 'contract' and edges:
+                    a, b = rng.choice(edges)
+                    if fg.vertexindex[a] != fg.vertexindex[b]:
+                        fg.contract_edge(a, b)
+                recomputed(fg)
+
+
+def hbline(donor, acceptor, flags, entry='x'):
+    cols = [entry] * 22
+    cols[12], cols[13], cols[21] = str(donor), str(acceptor), flags
+    return ' '.join(cols) + '\n'
+
+
+class TestHbonds(object):
+    BONDS = [(5, 1, 'AA__US'), (8, 4, 'AA__SU'), (9, 6, 'AA__UU'),
+             (7, 2, 'AB_XUS'), (10, 3, 'AA__UX')]
+
+    def write(self, path, bonds):
+        with open(path, 'w') as fh:
+            fh.writelines(hbline(*b) for b in bonds)
+        return path
+
+    def test_read_hbonds(self):
+        lines = [hbline(*b) for b in self.BONDS]
+        assert read_hbonds(lines) == [(5, 1), (8, 4), (9, 6)]
+
+    def test_from_hbonds(self, tmp_path):
+        path = self.write(tmp_path / 'a.hb', self.BONDS)
+        fg = Fatgraph.from_hbonds(str(path))
+        assert fg == Fatgraph([tuple(range(1, 7))],
+                              [(1, 6), (2, 5), (3, 4)])
+        assert fg.genus == 0
+        empty = self.write(tmp_path / 'b.hb', self.BONDS[3:])
+        assert Fatgraph.from_hbonds(str(empty)).genus == 0
+
+    def test_from_hbonds_many(self, tmp_path):
+        self.write(tmp_path / 'a.hb', self.BONDS)
+        self.write(tmp_path / 'b.hb', self.BONDS[:2])
+        self.write(tmp_path / 'c.hb', self.BONDS[1:])
+        expected = [(p.stem, Fatgraph.from_hbonds(str(p), 'beta'))
+                    for p in sorted(tmp_path.iterdir())]
+        for jobs in (1, 2):
+            stats = {}
+            assert list(Fatgraph.from_hbonds_many(
+                tmp_path, 'beta', jobs=jobs, stats=stats)) == expected
+            assert stats['files'] == 3 and stats['lines'] == 11
+            assert stats['lines_per_second'] > 0
+        paths = [tmp_path / 'c.hb', tmp_path / 'a.hb']
+        assert [name for name, fg in
+                Fatgraph.from_hbonds_many(paths, jobs=1)] == ['c', 'a']
+
+    def test_from_hbonds_many_errors(self, tmp_path):
+        self.write(tmp_path / 'a.hb', self.BONDS)
+        # residue 5 donates twice
+        self.write(tmp_path / 'b.hb', [(5, 1, 'AA__US'), (5, 2, 'AA__US')])
+        self.write(tmp_path / 'c.hb', self.BONDS[1:])
+        good = [(p.stem, Fatgraph.from_hbonds(str(p)))
+                for p in (tmp_path / 'a.hb', tmp_path / 'c.hb')]
+        for jobs in (1, 2):
+            stats = {}
+            assert list(Fatgraph.from_hbonds_many(
+                tmp_path, jobs=jobs, errors='skip', chunk=1,
+                stats=stats)) == good
+            assert stats['files'] == 3 and stats['failed'] == 1
+            result = list(Fatgraph.from_hbonds_many(tmp_path, jobs=jobs,
+                                                    errors='yield'))
+            assert [name for name, _ in result] == ['a', 'b', 'c']
+            assert isinstance(result[1][1], ValueError)
+            loaded = []
+            with pytest.raises(ValueError):
+                for name, fg in Fatgraph.from_hbonds_many(tmp_path,
+                                                          jobs=jobs):
+                    loaded.append(name)
+            assert loaded == ['a']
+        paths = [tmp_path / 'a.hb', tmp_path / 'missing.hb']
+        assert [name for name, _ in Fatgraph.from_hbonds_many(
+            paths, jobs=1, errors='skip')] == ['a']
+
+    def test_from_hbonds_chains(self, tmp_path):
+        chains = [('1abcA', self.BONDS), ('1abcB', self.BONDS[:2]),
+                  ('2xyzA', self.BONDS[3:]), ('3defA', self.BONDS[1:])]
+        path = tmp_path / 'all.hb'
+        with open(path, 'w') as fh:
+            for entry, bonds in chains:
+                fh.writelines(hbline(*b, entry=entry) for b in bonds)
+                # blank lines between concatenated files are skipped
+                fh.write('\n  \n')
+        expected = []
+        for k, (entry, bonds) in enumerate(chains):
+            single = self.write(tmp_path / '{}.hb'.format(k), bonds)
+            expected.append((entry, Fatgraph.from_hbonds(str(single))))
+        assert list(Fatgraph.from_hbonds_chains(str(path))) == expected
+        empty = self.write(tmp_path / 'empty.hb', [])
+        assert list(Fatgraph.from_hbonds_chains(str(empty))) == []
+        split = tmp_path / 'split.hb'
+        with open(split, 'w') as fh:
+            for entry in ('1abcA', '1abcB', '1abcA'):
+                fh.writelines(hbline(*b, entry=entry) for b in self.BONDS)
+        chains = Fatgraph.from_hbonds_chains(str(split))
+        assert [next(chains)[0], next(chains)[0]] == ['1abcA', '1abcB']
+        with pytest.raises(ValueError, match='line 11'):
+            next(chains)
+        short = tmp_path / 'short.hb'
+        with open(short, 'w') as fh:
+            fh.write(hbline(5, 1, 'AA__US', entry='1abcA') + '1abcA 5 1\n')
+        with pytest.raises(ValueError, match='Line 2'):
+            list(Fatgraph.from_hbonds_chains(str(short)))
+
+    def test_genus_profile(self, tmp_path):
+        path = self.write(tmp_path / 'a.hb', self.BONDS)
+        profile = Fatgraph.genus_profile(str(path))
+        assert profile.tolist() == [[1, 0, 0], [2, 0, 0], [3, 0, 0],
+                                    [4, 0, 0], [5, 0, 2], [6, 0, 2],
+                                    [7, 0, 2], [8, 0, 3], [9, 0, 4]]
+        rng = random.Random(1)
+        for _ in range(50):
+            residues = rng.sample(range(1, 40), 24)
+            bonds = list(zip(residues[::2], residues[1::2]))
+            for bbtype in ('alpha', 'beta'):
+                for window, step in [(None, 1), (5, 1), (8, 3)]:
+                    profile = Fatgraph.profile_bonds(bonds, window, step,
+                                                     bbtype)
+                    for p, genus, boundaries in profile.tolist():
+                        inside = [b for b in bonds if max(b) <= p] \
+                            if window is None else \
+                            [b for b in bonds
+                             if p <= min(b) and max(b) < p + window]
+                        fg = Fatgraph.from_bonds(inside, bbtype)
+                        assert (genus, boundaries) == \
+                            (fg.genus, fg.nboundaries)
+        assert Fatgraph.profile_bonds([]).shape == (0, 3)
+        with pytest.raises(ValueError):
+            Fatgraph.profile_bonds([(5, 1), (5, 2)], 10)
@@ -1,5 +1,14 @@
+import collections
+import functools
 import itertools
-from fatgraph import Fatgraph, FatgraphB
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from fatgraph import Fatgraph, FatgraphB, FatgraphBatch, VertexSkeleton
+from fatgraph import characters, instrument
+from fatgraph.pairings import Pairings
+from fatgraph.unionfind import UnionFind, UndoableUnionFind
 
 def generateall(*args, l=0):
     '''
@@ -10,20 +19,7 @@ def generateall(*args, l=0):
     Note the generated list includes disconnected graphs. Use
     Fatgraph.isconnected() to check for connectedness.
     '''
-    vertices = []
-    start = 1
-    for i in args:
-        end = start + i
-        vertices.append(tuple(range(start, end)))
-        start = end
-    halfedges = [i for j in vertices for i in j]
-    fatgraphs = []
-    for exclude in itertools.combinations(halfedges, l):
-        newedges = [i for i in halfedges if i not in exclude]
-        alledges = [pairs for pairs in all_pairs(newedges)]
-        fatgraphs.extend([Fatgraph(vertices, edges)
-                          for edges in alledges])
-    return fatgraphs
+    return list(iter_all(*args, l=l))
 
 def generateallB(*args, l=0):
     '''
@@ -31,17 +27,452 @@ def generateallB(*args, l=0):
     vertices and valences.
     The generated graphs are always connected.
     '''
-    fatgraphBs =[]
-    fatgraphs = generateall(*args, l=l)
-    for graph in fatgraphs:
-        for ie in itertools.product(
-                *[paralleledges(vertex)
-                  for vertex in graph.vertices]):
-            int_edges = [p for ps in ie for p in ps]
+    return list(iter_allB(*args, l=l))
+
+def iter_all(*args, l=0, connected=None, genus=None, boundaries=None,
+             backend='permutation'):
+    '''
+    Yield the Fatgraphs of generateall(*args, l=l) one at a time, in
+    the same order. connected, genus and boundaries filter the output
+    and are checked on the pairing before any Fatgraph is built. Each
+    is either a value the graph must match (True/False for
+    connected, the genus, the number of boundary components) or a
+    predicate taking that value, e.g. genus=lambda g: g <= 1.
+    With filters the pairings are built by a branch-and-bound search
+    that abandons a partial pairing as soon as no completion of it
+    can pass, see _Search.
+    '''
+    vertices = makevertices(*args)
+    skeleton = _Skeleton(vertices)
+    shared = VertexSkeleton.get(vertices, backend)
+    for shard in _shards(vertices, l):
+        for edges in skeleton.pairings(shard, connected, genus,
+                                       boundaries):
+            if instrument.enabled:
+                instrument.count('produced')
+            yield Fatgraph.from_skeleton(shared, edges, validate=False)
+
+def iter_batches(*args, l=0, size=4096, **filters):
+    '''
+    Yield the graphs of iter_all(*args, l=l, **filters) as
+    FatgraphBatches of up to size graphs, in the same order, without
+    building a Fatgraph for each, e.g.
+        for batch in iter_batches(4, 4, 4):
+            genera = batch.genus
+    '''
+    vertices = makevertices(*args)
+    skeleton = _Skeleton(vertices)
+    edgelists = []
+    for shard in _shards(vertices, l):
+        for edges in skeleton.pairings(shard, **filters):
+            edgelists.append(edges)
+            if len(edgelists) == size:
+                yield FatgraphBatch.from_graphs(
+                    (vertices, e) for e in edgelists)
+                edgelists = []
+    if edgelists:
+        yield FatgraphBatch.from_graphs((vertices, e) for e in edgelists)
+
+def iter_allB(*args, l=0, backend='permutation', **filters):
+    '''
+    Yield the valid FatgraphBs of generateallB(*args, l=l) one at a
+    time, in the same order. filters are passed on to iter_all and
+    apply to the underlying Fatgraph.
+    '''
+    for graph in iter_all(*args, l=l, backend=backend, **filters):
+        for int_edges in interioredges(graph):
             fg = FatgraphB.from_fatgraph(graph, int_edges)
             if fg.isvalid():
-                fatgraphBs.append(fg)
-    return fatgraphBs
+                if instrument.enabled:
+                    instrument.count('producedB')
+                yield fg
+            elif instrument.enabled:
+                instrument.count('rejected_invalid')
+
+def interioredges(graph):
+    '''
+    Yield the interior edges of the choices of paralleledges at every
+    vertex of graph that can give a valid FatgraphB, in the order of
+    itertools.product. Vertices are assigned one at a time while a
+    union-find over the half-edges tracks the paths formed by exterior
+    and interior edges. Every half-edge is on at most two of these
+    edges, so an interior edge joining two half-edges already on the
+    same path closes a loop that no later edge can extend; unless it
+    is the very last edge the assignment can no longer be valid and
+    is abandoned.
+    '''
+    options = [list(paralleledges(vertex)) for vertex in graph.vertices]
+    if not all(options):
+        return
+    index = {h: k for k, h in enumerate(graph.halfedges)}
+    uf = UndoableUnionFind(len(index))
+    for e in graph.edges:
+        if len(e) == 2:
+            uf.union(index[e[0]], index[e[1]])
+    remaining = [sum(len(o[0]) for o in options)]
+    chosen = []
+
+    def assign(k):
+        if k == len(options):
+            yield [p for ps in chosen for p in ps]
+            return
+        for option in options[k]:
+            added = 0
+            for a, b in option:
+                added += 1
+                remaining[0] -= 1
+                if not uf.union(index[a], index[b]) and remaining[0]:
+                    if instrument.enabled:
+                        instrument.count('pruned')
+                    break
+            else:
+                chosen.append(option)
+                yield from assign(k + 1)
+                chosen.pop()
+            for _ in range(added):
+                uf.undo()
+            remaining[0] += added
+
+    yield from assign(0)
+
+def iter_all_parallel(*args, l=0, jobs=None, backend='permutation',
+                      **filters):
+    '''
+    Same as iter_all, but the pairings are enumerated by a pool of
+    jobs worker processes (default: one per CPU). The search tree is
+    split by the marked-point subset and by the partner of the first
+    half-edge; workers return only the edge lists of the graphs that
+    pass filters, and graphs are yielded in the order of iter_all.
+    Filter predicates must be picklable, e.g. module-level functions.
+    '''
+    vertices = makevertices(*args)
+    work = functools.partial(_shard_edges, args, filters)
+    shared = VertexSkeleton.get(vertices, backend)
+    with ProcessPoolExecutor(jobs) as executor:
+        for edgelists in executor.map(work, _shards(vertices, l)):
+            for edges in edgelists:
+                if instrument.enabled:
+                    instrument.count('produced')
+                yield Fatgraph.from_skeleton(shared, edges, validate=False)
+
+def iter_range(*args, l=0, start=0, stop=None, checkpoint=None,
+               every=10000, backend='permutation'):
+    '''
+    Yield (index, fatgraph) for the graphs of generateall(*args, l=l)
+    at positions start to stop, numbered as in pairings.Pairings, so
+    disjoint ranges can run as separate jobs, see Pairings.ranges.
+    If checkpoint is a path, the position of the next graph is saved
+    there as JSON every every graphs and when the range is done, and
+    an existing checkpoint for the same arguments is resumed from: a
+    graph counts as done once the next one is asked for. A job killed
+    and restarted with the same arguments resumes from the last
+    checkpoint, so delivery is at least once: up to every - 1 graphs
+    yielded before the kill are yielded again. every=1 saves on every
+    advance, so only the graph being handled at the kill is repeated.
+    '''
+    pairings = Pairings(*args, l=l)
+    stop = pairings.total if stop is None else min(stop, pairings.total)
+    state = {'valences': list(args), 'l': l, 'start': start, 'stop': stop,
+             'next': start}
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as fh:
+            saved = json.load(fh)
+        if any(saved.get(key) != value for key, value in state.items()
+               if key != 'next'):
+            raise ValueError('Checkpoint {} is for another range'.format(
+                checkpoint))
+        state['next'] = saved['next']
+    shared = VertexSkeleton.get(makevertices(*args), backend)
+    index = state['next']
+    for edges in pairings.iter(index, stop):
+        if checkpoint is not None and (index - start) % every == 0:
+            _savecheckpoint(checkpoint, dict(state, next=index))
+        if instrument.enabled:
+            instrument.count('produced')
+        yield index, Fatgraph.from_skeleton(shared, edges, validate=False)
+        index += 1
+    if checkpoint is not None:
+        _savecheckpoint(checkpoint, dict(state, next=stop))
+
+def iter_rangeB(*args, l=0, start=0, stop=None, checkpoint=None,
+                every=10000, backend='permutation'):
+    '''
+    Yield (index, fatgraphB) for the valid FatgraphBs of the graphs at
+    positions start to stop of generateall(*args, l=l), in the order of
+    iter_allB, where index is the position of the underlying Fatgraph.
+    Checkpoints are kept as in iter_range.
+    '''
+    for index, graph in iter_range(*args, l=l, start=start, stop=stop,
+                                   checkpoint=checkpoint, every=every,
+                                   backend=backend):
+        for int_edges in interioredges(graph):
+            fg = FatgraphB.from_fatgraph(graph, int_edges)
+            if fg.isvalid():
+                if instrument.enabled:
+                    instrument.count('producedB')
+                yield index, fg
+            elif instrument.enabled:
+                instrument.count('rejected_invalid')
+
+def _savecheckpoint(path, state):
+    "Write state to path as JSON, replacing the old file atomically."
+    temporary = '{}.tmp'.format(path)
+    with open(temporary, 'w') as fh:
+        json.dump(state, fh)
+    os.replace(temporary, path)
+
+def genus_counts(*args, l=0, connected=None, jobs=None):
+    '''
+    Return a dictionary mapping genus to the number of graphs of that
+    genus in generateall(*args, l=l), optionally only the connected
+    (connected=True) or disconnected ones. The pairings are counted
+    inside jobs worker processes; jobs=1 counts in this process.
+    '''
+    vertices = makevertices(*args)
+    work = functools.partial(_shard_genus, args, connected)
+    total = collections.Counter()
+    if jobs == 1:
+        for count in map(work, _shards(vertices, l)):
+            total.update(count)
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            for count in executor.map(work, _shards(vertices, l)):
+                total.update(count)
+    return dict(sorted(total.items()))
+
+def count_by_genus(*args, l=0):
+    '''
+    Return a dictionary mapping genus to the number of graphs of that
+    genus in generateall(*args, l=l), computed without enumerating
+    them. The edge permutations eps with m edges and l fixed points
+    are counted by the number of cycles of sigma*eps with the
+    character formula
+        sum over eps of x^c(sigma*eps)
+          = 1/(2^m m! l!) sum over shapes L of
+            chi_L(sigma) chi_L(eps) prod over cells (x + content),
+    see fatgraph.characters. An unpaired half-edge on a vertex of
+    valence 1 is a fixed point of sigma*eps but not a boundary, so
+    these are counted separately for each set of them left unpaired.
+    '''
+    return dict(_count_by_genus(tuple(sorted(args, reverse=True)), l))
+
+@functools.lru_cache(maxsize=None)
+def _count_by_genus(valences, l):
+    valences = tuple(v for v in valences if v > 0)
+    n = sum(valences)
+    if l > n:
+        return ()
+    # all_pairs leaves one more half-edge unpaired when there is an
+    # odd number left, producing every graph once per choice of it
+    # among the l + 1 unpaired half-edges.
+    multiplicity = 1
+    if (n - l) % 2:
+        l += 1
+        multiplicity = l
+    m = (n - l) // 2
+    # An unpaired half-edge on a 1-valent vertex is a fixed point of
+    # sigma*eps that is not a boundary, so sum over the j of them that
+    # stay unpaired, dropping those vertices, the ones at the end.
+    ones = valences.count(1)
+    nvertices = len(valences) - ones
+    counts = collections.Counter()
+    for j in range(min(ones, l) + 1):
+        rest = valences[:len(valences) - j]
+        for b, c in enumerate(_paired_ones(rest, l - j)):
+            if c:
+                genus = int((2 - nvertices + m - b) / 2) if nvertices else 0
+                counts[genus] += multiplicity * math.comb(ones, j) * c
+    return tuple(sorted(counts.items()))
+
+@functools.lru_cache(maxsize=None)
+def _paired_ones(valences, l):
+    '''
+    Number of edge permutations with l fixed points, none of them on a
+    1-valent vertex, by the number of cycles of sigma*eps: those of
+    _cycle_counts less, for each j, the ones fixing j given 1-valent
+    half-edges, each of which is a cycle of its own.
+    '''
+    counts = list(_cycle_counts(valences, l))
+    ones = valences.count(1)
+    for j in range(1, min(ones, l) + 1):
+        rest = _paired_ones(valences[:len(valences) - j], l - j)
+        for b, c in enumerate(rest):
+            counts[b + j] -= math.comb(ones, j) * c
+    return tuple(counts)
+
+@functools.lru_cache(maxsize=None)
+def _cycle_counts(valences, l):
+    "Number of edge permutations with l fixed points by cycles of sigma*eps."
+    n = sum(valences)
+    m = (n - l) // 2
+    edgetype = (2,) * m + (1,) * l
+    total = [0] * (n + 1)
+    for shape in characters.partitions(n):
+        chi = characters.character(shape, valences)
+        if chi == 0:
+            continue
+        chi *= characters.character(shape, edgetype)
+        for b, c in enumerate(characters.contentpolynomial(shape)):
+            total[b] += chi * c
+    norm = 2**m * math.factorial(m) * math.factorial(l)
+    return tuple(c // norm for c in total)
+
+def _shards(vertices, l):
+    '''
+    Split the pairings of generateall into independent pieces, in
+    generation order. Each shard is a list of edges fixed by the
+    first choice of all_pairs and the half-edges left to pair.
+    '''
+    halfedges = [i for j in vertices for i in j]
+    for exclude in itertools.combinations(halfedges, l):
+        lst = [i for i in halfedges if i not in exclude]
+        if not lst:
+            yield [], []
+        elif len(lst) % 2 == 1:
+            for i in range(len(lst)):
+                yield [], lst[:i] + lst[i+1:]
+        else:
+            for i in range(1, len(lst)):
+                yield [(lst[0], lst[i])], lst[1:i] + lst[i+1:]
+
+def _shard_edges(args, filters, shard):
+    skeleton = _Skeleton(makevertices(*args))
+    return list(skeleton.pairings(shard, **filters))
+
+def _shard_genus(args, connected, shard):
+    skeleton = _Skeleton(makevertices(*args))
+    count = collections.Counter()
+    for edges in skeleton.pairings(shard, connected):
+        count[skeleton.genus(len(edges),
+                             skeleton.nboundaries(edges))] += 1
+    return count
+
+def iter_classes(*args, l=0, backend='permutation', **filters):
+    '''
+    Yield one (fatgraph, automorphisms) pair for each isomorphism
+    class among the graphs of iter_all(*args, l=l, **filters); the
+    representative is the first graph of its class in generation
+    order. Each class stands for
+        multiplicity(*args, l=l) * nsymmetries(*args) // automorphisms
+    graphs of generateall, so weighted counts match its length.
+    Only the canonical forms of the classes seen so far are kept.
+    '''
+    seen = set()
+    for fg in iter_all(*args, l=l, backend=backend, **filters):
+        form = fg.canonical_form()
+        if form not in seen:
+            seen.add(form)
+            yield fg, fg.automorphisms
+
+def multiplicity(*args, l=0):
+    '''
+    Number of times generateall(*args, l=l) lists each graph: when an
+    odd number of half-edges is left after the l marked points,
+    all_pairs leaves one more unpaired, so each graph appears once per
+    choice of it among its l + 1 unpaired half-edges.
+    '''
+    return l + 1 if (sum(args) - l) % 2 else 1
+
+def nsymmetries(*args):
+    '''
+    Number of relabellings of the vertices given by valences args
+    that keep the cyclic order at each vertex: vertices of equal
+    valence can be permuted and each vertex rotated. Vertices of
+    valence 0 have no half-edges to relabel, so they are left out,
+    as they are by Fatgraph.automorphisms.
+    '''
+    n = 1
+    for valence, group in itertools.groupby(sorted(args)):
+        if valence:
+            k = len(list(group))
+            n *= math.factorial(k) * valence**k
+    return n
+
+def makevertices(*args):
+    '''
+    Vertices with the given valences, numbering half-edges from 1.
+    e.x. makevertices(2,3) returns [(1,2), (3,4,5)].
+    '''
+    vertices = []
+    start = 1
+    for i in args:
+        end = start + i
+        vertices.append(tuple(range(start, end)))
+        start = end
+    return vertices
+
+def _matches(value, spec):
+    if spec is None:
+        return True
+    if callable(spec):
+        return spec(value)
+    return value == spec
+
+
+class _Skeleton(object):
+    '''
+    Invariants of the pairings on a fixed set of vertices, computed
+    from the list of edges alone so that rejected pairings never
+    become Fatgraph objects. The results agree with
+    Fatgraph.isconnected, Fatgraph.nboundaries and Fatgraph.genus.
+    '''
+
+    def __init__(self, vertices):
+        self.vertices = vertices
+        self.vertexindex = {h: k for k, v in enumerate(vertices)
+                            for h in v}
+        self.size = max(self.vertexindex, default=0) + 1
+        self.sigma = list(range(self.size))
+        for v in vertices:
+            for h, k in zip(v, v[1:] + v[:1]):
+                self.sigma[h] = k
+        # Half-edges that are alone on their vertex; Fatgraph does not
+        # count them as boundaries when they are also unpaired.
+        self.lonely = [v[0] for v in vertices if len(v) == 1]
+        self.nvertices = len([v for v in vertices if len(v) > 1])
+
+    def pairings(self, shard, connected=None, genus=None,
+                 boundaries=None):
+        "Yield the edge lists completing shard that pass the filters."
+        first, rest = shard
+        if connected is None and genus is None and boundaries is None:
+            for pairs in all_pairs(rest):
+                yield first + pairs
+            return
+        search = _Search(self, first, rest, connected, genus, boundaries)
+        if search.feasible():
+            for pairs in search.pairs(rest):
+                yield first + pairs
+        elif instrument.enabled:
+            instrument.count('pruned')
+
+    def isconnected(self, edges):
+        uf = UnionFind(len(self.vertices))
+        for a, b in edges:
+            uf.union(self.vertexindex[a], self.vertexindex[b])
+        return uf.ncomponents <= 1
+
+    def nboundaries(self, edges):
+        eps = list(range(self.size))
+        for a, b in edges:
+            eps[a], eps[b] = b, a
+        sigma = self.sigma
+        seen = [False] * self.size
+        count = 0
+        for h in self.vertexindex:
+            if seen[h]:
+                continue
+            count += 1
+            while not seen[h]:
+                seen[h] = True
+                h = sigma[eps[h]]
+        return count - len([h for h in self.lonely if eps[h] == h])
+
+    def genus(self, nedges, nboundaries):
+        if self.nvertices == 0:
+            return 0
+        return int((2 - self.nvertices + nedges - nboundaries) / 2)
+
 
 def paralleledges(vertex):
     ids = [(i, -(i+1)) for i in range(int(len(vertex)/2))]
@@ -50,6 +481,91 @@ def paralleledges(vertex):
         
             
 
+class _Search(object):
+    '''
+    Branch-and-bound version of all_pairs. Edges are added in the
+    order of all_pairs while the boundary permutation phi = sigma*eps
+    and a union-find over the vertices are updated in place. Adding
+    an edge (a, b) multiplies phi by the transposition (a b), which
+    splits the boundary cycle through a and b or merges the two
+    cycles through them, so with k edges still to add the final
+    number of boundaries is within k of the current one. A branch is
+    abandoned when no number in that range passes the genus and
+    boundaries filters, or when k edges can no longer join the
+    components of a graph required to be connected.
+    '''
+
+    def __init__(self, skeleton, first, rest, connected, genus,
+                 boundaries):
+        self.vertexindex = skeleton.vertexindex
+        self.phi = list(skeleton.sigma)
+        self.uf = UndoableUnionFind(len(skeleton.vertices))
+        self.connected = connected
+        self.remaining = len(rest) // 2 + len(first)
+        self.history = []
+        # Cycles of phi, counting the fixed points that Fatgraph
+        # does not count as boundaries separately.
+        self.ncycles = len([v for v in skeleton.vertices if v])
+        paired = set(rest).union(*first)
+        self.lonely = len([h for h in skeleton.lonely if h not in paired])
+        if genus is None and boundaries is None:
+            self.allowed = None
+        else:
+            nedges = self.remaining
+            self.allowed = [
+                _matches(b, boundaries) and
+                _matches(skeleton.genus(nedges, b), genus)
+                for b in range(len(skeleton.vertexindex) + 1)]
+        for a, b in first:
+            self.add(a, b)
+
+    def add(self, a, b):
+        phi = self.phi
+        h = phi[a]
+        while h != a and h != b:
+            h = phi[h]
+        self.history.append(self.ncycles)
+        self.ncycles += 1 if h == b else -1
+        phi[a], phi[b] = phi[b], phi[a]
+        self.uf.union(self.vertexindex[a], self.vertexindex[b])
+        self.remaining -= 1
+
+    def remove(self, a, b):
+        phi = self.phi
+        phi[a], phi[b] = phi[b], phi[a]
+        self.ncycles = self.history.pop()
+        self.uf.undo()
+        self.remaining += 1
+
+    def feasible(self):
+        k = self.remaining
+        if k == 0 and self.connected is not None and \
+           not _matches(self.uf.ncomponents <= 1, self.connected):
+            return False
+        if self.connected is True and self.uf.ncomponents - k > 1:
+            return False
+        if self.allowed is None:
+            return True
+        low = max(self.ncycles - k - self.lonely, 0)
+        high = min(self.ncycles + k - self.lonely, len(self.allowed) - 1)
+        low += (self.ncycles - k - self.lonely - low) % 2
+        return any(self.allowed[low:high + 1:2])
+
+    def pairs(self, lst):
+        if not lst:
+            yield []
+            return
+        a = lst[0]
+        for i in range(1, len(lst)):
+            self.add(a, lst[i])
+            if self.feasible():
+                for rest in self.pairs(lst[1:i] + lst[i+1:]):
+                    yield [(a, lst[i])] + rest
+            elif instrument.enabled:
+                instrument.count('pruned')
+            self.remove(a, lst[i])
+
+
 def all_pairs(lst):
     if not lst:
         yield []
@@ -0,0 +1,167 @@
+import itertools
+import pytest
+from .fatgraph import Fatgraph, FatgraphB
+from . import fggen
+
+CASES = [((3,3), 0), ((4,), 0), ((2,4), 2), ((1,3,2), 0), ((3,), 1),
+         ((2,2,2), 0), ((4,4), 0)]
+
+
+class TestGenerate(object):
+    def test_generateall(self):
+        fgs = fggen.generateall(3,3)
+        assert len(fgs) == 15
+        assert all(isinstance(fg, Fatgraph) for fg in fgs)
+        assert len(fggen.generateall(2,2, l=2)) == 6 * 1
+
+    def test_iter_all(self):
+        for valences, l in CASES:
+            fgs = fggen.generateall(*valences, l=l)
+            assert list(fggen.iter_all(*valences, l=l)) == fgs
+            for c in (True, False):
+                assert list(fggen.iter_all(*valences, l=l,
+                                           connected=c)) == \
+                    [fg for fg in fgs if fg.isconnected() == c]
+            for g in (0, 1, 2):
+                assert list(fggen.iter_all(*valences, l=l, genus=g)) == \
+                    [fg for fg in fgs if fg.genus == g]
+            for b in (1, 2, 3):
+                assert list(fggen.iter_all(*valences, l=l,
+                                           boundaries=b)) == \
+                    [fg for fg in fgs if len(fg.boundaries) == b]
+            assert list(fggen.iter_all(*valences, l=l,
+                                       genus=lambda g: g > 0)) == \
+                [fg for fg in fgs if fg.genus > 0]
+
+    def test_iter_allB(self):
+        fgbs = fggen.generateallB(2,4)
+        assert all(isinstance(fg, FatgraphB) and fg.isvalid()
+                   for fg in fgbs)
+        assert list(fggen.iter_allB(2,4, genus=0)) == \
+            [fg for fg in fgbs if fg.genus == 0]
+
+    def test_iter_classes(self):
+        classes = list(fggen.iter_classes(4))
+        assert [(len(fg.boundaries), aut) for fg, aut in classes] == \
+            [(3, 2), (1, 4)]
+        for valences, l in CASES + [((4,), 1), ((3,3,2), 3), ((0,0,2), 0),
+                                    ((0,0,2), 1), ((0,0,2), 2),
+                                    ((0,3,0,3), 1)]:
+            fgs = fggen.generateall(*valences, l=l)
+            classes = list(fggen.iter_classes(*valences, l=l))
+            assert len(classes) == \
+                len(set(fg.canonical_form() for fg in fgs))
+            weight = fggen.multiplicity(*valences, l=l) * \
+                fggen.nsymmetries(*valences)
+            assert sum(weight // aut for fg, aut in classes) == len(fgs)
+        classes = list(fggen.iter_classes(3,3,3,3, genus=0))
+        assert sum(fggen.nsymmetries(3,3,3,3) // aut
+                   for fg, aut in classes) == \
+            len(list(fggen.iter_all(3,3,3,3, genus=0)))
+
+    def test_iter_range(self, tmp_path):
+        fgs = fggen.generateall(4, 4, l=1)
+        assert [fg for _, fg in fggen.iter_range(4, 4, l=1)] == fgs
+        assert [i for i, _ in fggen.iter_range(4, 4, l=1, start=5,
+                                               stop=9)] == [5, 6, 7, 8]
+        path = str(tmp_path / 'run.json')
+        done = []
+        for i, fg in fggen.iter_range(4, 4, l=1, start=10, stop=200,
+                                      checkpoint=path, every=7):
+            if i == 100:
+                break
+            done.append(fg)
+        # Graph 100 was not finished, so the run resumes at the last
+        # checkpoint before it, 10 + 12*7, and repeats graphs 94 to 99.
+        resumed = list(fggen.iter_range(4, 4, l=1, start=10, stop=200,
+                                        checkpoint=path, every=7))
+        assert resumed[0][0] == 94
+        assert done[:84] + [fg for _, fg in resumed] == fgs[10:200]
+        assert list(fggen.iter_range(4, 4, l=1, start=10, stop=200,
+                                     checkpoint=path)) == []
+        with pytest.raises(ValueError):
+            list(fggen.iter_range(4, 4, l=1, start=0, stop=200,
+                                  checkpoint=path))
+        path = str(tmp_path / 'each.json')
+        for i, fg in fggen.iter_range(4, 4, l=1, stop=50, checkpoint=path,
+                                      every=1):
+            if i == 20:
+                break
+        # With every=1 only the unfinished graph 20 is repeated.
+        assert [i for i, _ in fggen.iter_range(4, 4, l=1, stop=50,
+                                               checkpoint=path,
+                                               every=1)][0] == 20
+        fgbs = fggen.generateallB(4, 4)
+        assert [fg for _, fg in fggen.iter_rangeB(4, 4)] == fgbs
+
+    def test_parallel(self):
+        for valences, l in [((3,3,2), 0), ((2,3), 1), ((4,), 0)]:
+            fgs = fggen.generateall(*valences, l=l)
+            assert list(fggen.iter_all_parallel(*valences, l=l,
+                                                jobs=2)) == fgs
+            assert list(fggen.iter_all_parallel(*valences, l=l, jobs=2,
+                                                genus=0)) == \
+                [fg for fg in fgs if fg.genus == 0]
+            counts = {}
+            for fg in fgs:
+                if fg.isconnected():
+                    counts[fg.genus] = counts.get(fg.genus, 0) + 1
+            for jobs in (1, 2):
+                assert fggen.genus_counts(*valences, l=l, jobs=jobs,
+                                          connected=True) == counts
+
+    def test_pruned_search(self):
+        fgs = fggen.generateall(3,3,3,3)
+        for g in (0, 1):
+            assert list(fggen.iter_all(3,3,3,3, connected=True,
+                                       genus=g, boundaries=6 - 2*g)) == \
+                [fg for fg in fgs if fg.isconnected() and
+                 fg.genus == g and len(fg.boundaries) == 6 - 2*g]
+        fgs = fggen.generateall(2,3,3, l=2)
+        assert list(fggen.iter_all(2,3,3, l=2, connected=True,
+                                   genus=lambda g: g <= 0)) == \
+            [fg for fg in fgs if fg.isconnected() and fg.genus <= 0]
+
+    def test_count_by_genus(self):
+        for valences, l in CASES + [((2,3), 1), ((3,3,2), 0),
+                                    ((2,3,3), 2), ((5,), 2)]:
+            assert fggen.count_by_genus(*valences, l=l) == \
+                fggen.genus_counts(*valences, l=l, jobs=1)
+        # Harer-Zagier numbers for a single 8-valent vertex
+        assert fggen.count_by_genus(8) == {0: 14, 1: 70, 2: 21}
+        counts = fggen.count_by_genus(4,4,4,4,4,4)
+        assert sum(counts.values()) == 23*21*19*17*15*13*11*9*7*5*3
+        # unpaired half-edges on 1-valent vertices
+        for valences, l in [((1,2), 1), ((3,1,1), 0), ((1,), 0),
+                            ((1,1,2), 1), ((1,1,1,3), 2)]:
+            assert fggen.count_by_genus(*valences, l=l) == \
+                fggen.genus_counts(*valences, l=l, jobs=1)
+        assert fggen.count_by_genus(3,1,1) == {0: 9, 1: 6}
+        assert fggen.count_by_genus(1) == {0: 1}
+
+    def test_interioredges(self):
+        for valences, l in [((2,4), 0), ((4,4), 0), ((2,2,4), 0),
+                            ((2,4), 2), ((6,), 0), ((2,2), 1)]:
+            expected = []
+            for graph in fggen.generateall(*valences, l=l):
+                for ie in itertools.product(
+                        *[fggen.paralleledges(vertex)
+                          for vertex in graph.vertices]):
+                    int_edges = [p for ps in ie for p in ps]
+                    fg = FatgraphB.from_fatgraph(graph, int_edges)
+                    if fg.isvalid():
+                        expected.append(fg)
+            assert fggen.generateallB(*valences, l=l) == expected
+
+    def test_generateallB_counts(self):
+        # Counts of the original generateallB, including odd valences
+        # with marked points where the walk of isvalid starts at a
+        # marked point that is not the smallest.
+        counts = {((3,3,2), 1): 96, ((3,3,2), 3): 56, ((5,3), 1): 304,
+                  ((3,3), 2): 8, ((3,2), 1): 4, ((5,), 1): 8,
+                  ((2,2,2), 1): 48, ((2,4), 2): 48, ((4,4), 0): 192}
+        for (valences, l), count in counts.items():
+            assert len(fggen.generateallB(*valences, l=l)) == count
+        fg = FatgraphB([(1,2,3), (4,5,6), (7,8)], [(1,5), (3,6), (4,7)],
+                       [(1,3), (4,6), (7,8)])
+        assert fg.isvalid()
@@ -0,0 +1,228 @@
+'''
+Columnar index of per-protein invariants, so questions about a whole
+corpus are answered from a few NumPy arrays instead of by loading
+every protein. For each protein the index holds its genus, number of
+sheets (vertices), number of chords (half-edges / 2) and number of
+boundary components in one array per column, and the strands of each
+sheet (valence / 2) as offsets and a flat array, like a corpus file.
+
+    index = InvariantIndex.load('proteins.npz')
+    index.update(Corpus('proteins.fgc'))
+    rows = index.query(['genus>=5', 'sheets>3'], sort='genus')
+
+update only computes the proteins not in the index yet, genus and
+boundaries for a chunk of them at a time with FatgraphBatch.
+'''
+
+import fnmatch
+import operator
+import os
+import pathlib
+import pickle
+import re
+
+import numpy as np
+
+from .batch import FatgraphBatch
+
+COLUMNS = ('genus', 'sheets', 'chords', 'boundaries', 'max_strands')
+
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt,
+             '>=': operator.ge, '=': operator.eq, '==': operator.eq,
+             '!=': operator.ne}
+
+AGGREGATES = {'count': len, 'sum': np.sum, 'mean': np.mean,
+              'min': np.min, 'max': np.max}
+
+CONDITION = re.compile(r'^\s*(\w+)\s*(<=|>=|==|!=|=|<|>)\s*(\S+)\s*$')
+
+
+class PickleDirectory(object):
+    '''
+    The {name}.pkl files of a directory, as read by scripts/compute.py,
+    as a mapping from name to (vertices, edges, interiors, sequence).
+    '''
+
+    def __init__(self, path, pattern='*.pkl'):
+        self.path = pathlib.Path(path)
+        self.pattern = pattern
+
+    def __iter__(self):
+        return (p.stem for p in sorted(self.path.glob(self.pattern)))
+
+    def __getitem__(self, name):
+        with open(self.path / '{}.pkl'.format(name), 'rb') as fh:
+            return pickle.load(fh)
+
+
+class InvariantIndex(object):
+    '''
+    Invariants of a set of proteins, one row per protein in the order
+    they were added. names is an array of the names and columns maps
+    each of COLUMNS to an integer array; strand_start and strand_flat
+    hold the strands of the sheets of row k in
+    strand_flat[strand_start[k]:strand_start[k+1]].
+    '''
+
+    def __init__(self, names=(), columns=None, strand_start=None,
+                 strand_flat=None):
+        self.names = np.asarray(names, dtype=str)
+        if columns is None:
+            columns = {c: np.zeros(0, dtype=np.int64) for c in COLUMNS}
+        self.columns = {c: np.asarray(columns[c], dtype=np.int64)
+                        for c in COLUMNS}
+        self.strand_start = np.zeros(1, dtype=np.int64) \
+            if strand_start is None else np.asarray(strand_start)
+        self.strand_flat = np.zeros(0, dtype=np.int64) \
+            if strand_flat is None else np.asarray(strand_flat)
+        self._rows = None
+
+    @classmethod
+    def load(cls, path):
+        "Read an index saved by save, or an empty one if path is missing."
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['names'], {c: data[c] for c in COLUMNS},
+                       data['strand_start'], data['strand_flat'])
+
+    def save(self, path):
+        "Write the index to path as an .npz file, replacing it atomically."
+        temporary = '{}.tmp'.format(path)
+        with open(temporary, 'wb') as fh:
+            np.savez(fh, names=self.names, strand_start=self.strand_start,
+                     strand_flat=self.strand_flat, **self.columns)
+        os.replace(temporary, path)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._names()
+
+    def _names(self):
+        "Dictionary mapping each name to its row, built on first use."
+        if self._rows is None:
+            self._rows = {name: k
+                          for k, name in enumerate(self.names.tolist())}
+        return self._rows
+
+    def update(self, source, names=None, chunk=4096):
+        '''
+        Add the proteins of source that are not in the index yet and
+        return how many were added. source is a corpus.Corpus, a
+        PickleDirectory or any mapping from name to a
+        (vertices, edges, ...) entry; names limits it to those names.
+        '''
+        if names is None:
+            names = source
+        todo = [name for name in dict.fromkeys(names) if name not in self]
+        for k in range(0, len(todo), chunk):
+            part = todo[k:k + chunk]
+            self._append(part, [source[name][:2] for name in part])
+        return len(todo)
+
+    def _append(self, names, graphs):
+        batch = FatgraphBatch.from_graphs(graphs)
+        strands = [[len(v) // 2 for v in vertices] for vertices, _ in graphs]
+        new = {'genus': batch.genus,
+               'sheets': [len(s) for s in strands],
+               'chords': [sum(len(v) for v in vertices) // 2
+                          for vertices, _ in graphs],
+               'boundaries': batch.nboundaries,
+               'max_strands': [max(s, default=0) for s in strands]}
+        for c in COLUMNS:
+            self.columns[c] = np.concatenate(
+                [self.columns[c], np.asarray(new[c], dtype=np.int64)])
+        lengths = np.cumsum([len(s) for s in strands], dtype=np.int64)
+        self.strand_start = np.concatenate(
+            [self.strand_start, self.strand_start[-1] + lengths])
+        self.strand_flat = np.concatenate(
+            [self.strand_flat,
+             np.array([n for s in strands for n in s], dtype=np.int64)])
+        rows = self._names()
+        for name in names:
+            rows[name] = len(rows)
+        self.names = np.concatenate([self.names,
+                                     np.asarray(names, dtype=str)])
+
+    def strands(self, name):
+        "Number of strands of each sheet of name."
+        k = self._names()[name]
+        return self.strand_flat[
+            self.strand_start[k]:self.strand_start[k+1]].tolist()
+
+    def mask(self, conditions=()):
+        '''
+        Boolean array selecting the rows that satisfy every condition,
+        each a string 'column op value' with op one of OPERATORS, e.g.
+        'genus>=5'. For the column name, value is a glob pattern and
+        op is = or !=.
+        '''
+        selected = np.ones(len(self), dtype=bool)
+        for condition in conditions:
+            match = CONDITION.match(condition)
+            if match is None:
+                raise ValueError('Bad condition {!r}'.format(condition))
+            column, op, value = match.groups()
+            if column == 'name' and op in ('=', '==', '!='):
+                hits = np.isin(self.names,
+                               fnmatch.filter(self.names.tolist(), value))
+                selected &= hits if op != '!=' else ~hits
+            elif column in self.columns:
+                selected &= OPERATORS[op](self.columns[column], int(value))
+            else:
+                raise ValueError('Unknown column {!r}'.format(column))
+        return selected
+
+    def query(self, conditions=(), sort=None, reverse=False, limit=None):
+        '''
+        Return the rows satisfying conditions, see mask, as a list of
+        dictionaries of name, the COLUMNS and strands, sorted by the
+        column sort, rows with equal values in index order, and at most
+        limit of them.
+        '''
+        rows = np.flatnonzero(self.mask(conditions))
+        if sort == 'name':
+            order = np.argsort(self.names[rows])
+            rows = rows[order[::-1] if reverse else order]
+        elif sort is not None:
+            keys = self.columns[sort][rows]
+            rows = rows[np.argsort(-keys if reverse else keys, kind='stable')]
+        elif reverse:
+            rows = rows[::-1]
+        if limit is not None:
+            rows = rows[:limit]
+        return [self.row(k) for k in rows.tolist()]
+
+    def row(self, k):
+        "Row k as a dictionary."
+        result = {'name': str(self.names[k])}
+        result.update((c, int(self.columns[c][k])) for c in COLUMNS)
+        result['strands'] = self.strand_flat[
+            self.strand_start[k]:self.strand_start[k+1]].tolist()
+        return result
+
+    def aggregate(self, column, how='count', by=None, conditions=()):
+        '''
+        Apply how, one of AGGREGATES, to column over the rows
+        satisfying conditions. If by is a column, return a dictionary
+        mapping each of its values to the aggregate over its rows.
+        '''
+        selected = self.mask(conditions)
+        values = self.columns[column][selected]
+        func = AGGREGATES[how]
+        if by is None:
+            return _scalar(func(values)) if len(values) or how == 'count' \
+                else None
+        groups = self.columns[by][selected]
+        keys, inverse = np.unique(groups, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        parts = np.split(values[order],
+                         np.cumsum(np.bincount(inverse))[:-1])
+        return {int(key): _scalar(func(part))
+                for key, part in zip(keys, parts)}
+
+
+def _scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
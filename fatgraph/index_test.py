@@ -0,0 +1,87 @@
+import pickle
+import pytest
+from .fatgraph import Fatgraph
+from .corpus import Corpus, write_corpus
+from .index import InvariantIndex, PickleDirectory
+
+ENTRIES = [
+    ('1abcA', ([(1,2,3,4,5,6)], [(2,3), (5,6)],
+               [(1,6), (2,5), (3,4)], 'MKVL')),
+    ('2xyzB', ([(1,2,3,4), (5,6)], [(3,4), (2,5)],
+               [(1,4), (2,3), (5,6)], 'GAVLI')),
+    ('3empA', ([], [], [], '')),
+    ('4genC', ([(1,2,3,4), (5,6,7,8)], [(1,5), (2,7), (3,6), (4,8)],
+               [], '')),
+]
+
+
+class TestInvariantIndex(object):
+    def test_update(self, tmp_path):
+        path = tmp_path / 'corpus.fgc'
+        write_corpus(path, ENTRIES)
+        index = InvariantIndex()
+        with Corpus(path) as corpus:
+            assert index.update(corpus, names=['2xyzB']) == 1
+            assert index.update(corpus) == 3
+            assert index.update(corpus) == 0
+        assert list(index.names) == ['2xyzB', '1abcA', '3empA', '4genC']
+        for name, (vertices, edges, _, _) in ENTRIES:
+            fg = Fatgraph(vertices, edges)
+            row = index.query(['name={}'.format(name)])[0]
+            assert row == {'name': name, 'genus': fg.genus,
+                           'sheets': len(vertices),
+                           'chords': len(fg.halfedges) // 2,
+                           'boundaries': fg.nboundaries,
+                           'max_strands': max([len(v) // 2
+                                               for v in vertices],
+                                              default=0),
+                           'strands': [len(v) // 2 for v in vertices]}
+            assert index.strands(name) == row['strands']
+        saved = tmp_path / 'index.npz'
+        index.save(saved)
+        loaded = InvariantIndex.load(saved)
+        assert loaded.query() == index.query()
+        assert len(InvariantIndex.load(tmp_path / 'none.npz')) == 0
+
+    def test_pickle_directory(self, tmp_path):
+        for name, entry in ENTRIES:
+            with open(tmp_path / '{}.pkl'.format(name), 'wb') as fh:
+                pickle.dump(entry, fh)
+        source = PickleDirectory(tmp_path)
+        assert list(source) == [name for name, _ in ENTRIES]
+        index = InvariantIndex()
+        assert index.update(source, chunk=3) == 4
+        assert '4genC' in index and 'none' not in index
+
+    def test_query(self):
+        index = InvariantIndex()
+        index.update(dict(ENTRIES))
+        names = lambda rows: [r['name'] for r in rows]
+        assert names(index.query(['genus>=1'])) == ['4genC']
+        assert names(index.query(['sheets>1', 'chords = 3'])) == ['2xyzB']
+        assert names(index.query(sort='boundaries')) == \
+            ['3empA', '2xyzB', '4genC', '1abcA']
+        assert names(index.query(sort='boundaries', reverse=True)) == \
+            ['1abcA', '2xyzB', '4genC', '3empA']
+        assert names(index.query(sort='chords', reverse=True,
+                                 limit=2)) == ['4genC', '1abcA']
+        assert names(index.query(['name!=*A'], sort='name',
+                                 reverse=True)) == ['4genC', '2xyzB']
+        with pytest.raises(ValueError):
+            index.query(['genus~1'])
+        with pytest.raises(ValueError):
+            index.query(['size>1'])
+
+    def test_aggregate(self):
+        index = InvariantIndex()
+        index.update(dict(ENTRIES))
+        assert index.aggregate('genus') == 4
+        assert index.aggregate('chords', 'sum') == 10
+        assert index.aggregate('chords', 'max', conditions=['sheets=2']) \
+            == 4
+        assert index.aggregate('chords', 'mean', by='sheets') == \
+            {0: 0.0, 1: 3.0, 2: 3.5}
+        assert index.aggregate('genus', 'min', conditions=['genus>9']) \
+            is None
+        assert index.aggregate('genus', 'count', by='genus',
+                               conditions=['genus>9']) == {}
@@ -0,0 +1,150 @@
+'''
+Opt-in instrumentation of the hot paths of the package. While enabled,
+every call of the operations in OPERATIONS is counted and timed, with
+the number of items it handled, and the generators in fggen count the
+graphs they produce and the ones they prune or reject:
+
+    from fatgraph import instrument
+    with instrument.profiling():
+        fggen.generateallB(4, 4)
+    print(instrument.to_json())
+
+Operations are timed by wrapping them when enable is called and
+restoring the originals in disable, so they cost nothing while
+instrumentation is off; the counters cost one check of enabled at the
+places they count. Times include nested operations, e.g. construction
+inside from_pmat. construction counts every graph built, by the
+constructor and from_skeleton or from the arrays of a corpus by
+from_arrays. Only this process is measured, not worker processes.
+'''
+
+import contextlib
+import functools
+import importlib
+import json
+import time
+from collections import Counter
+
+enabled = False
+
+# Operation name, the module and attribute timed, and a function of
+# the arguments and result giving the number of items handled.
+OPERATIONS = [
+    ('construction', 'fatgraph', 'Fatgraph._attach',
+     lambda args, result: len(args[1].halfedges)),
+    ('construction', 'fatgraph', 'Fatgraph.from_arrays',
+     lambda args, result: len(result.halfedges)),
+    ('boundaries', 'fatgraph', 'Fatgraph._boundaries',
+     lambda args, result: len(result)),
+    ('isconnected', 'fatgraph', 'Fatgraph.isconnected',
+     lambda args, result: len(args[0].vertices)),
+    ('isvalid', 'fatgraph', 'FatgraphB.isvalid',
+     lambda args, result: len(args[0].vertices)),
+    ('read_hbonds', 'fatgraph', 'read_hbonds',
+     lambda args, result: len(result)),
+    ('from_pmat', 'fatgraph', 'FatgraphB.from_pmat',
+     lambda args, result: len(result.vertices)),
+]
+
+# Generation counters: graphs produced by the enumerations, branches of
+# a search abandoned early, and graphs rejected by a validity or
+# connectedness check.
+COUNTERS = ('produced', 'producedB', 'pruned', 'rejected_invalid',
+            'rejected_disconnected')
+
+_timings = {}
+_counters = Counter()
+_originals = []
+
+
+def enable():
+    "Start recording; does nothing if already enabled."
+    global enabled
+    if enabled:
+        return
+    for name, module, path, items in OPERATIONS:
+        owner, attr = _resolve(module, path)
+        original = owner.__dict__[attr] if isinstance(owner, type) \
+            else getattr(owner, attr)
+        _originals.append((owner, attr, original))
+        setattr(owner, attr, _timed(name, original, items))
+    enabled = True
+
+
+def disable():
+    "Stop recording and restore the original operations."
+    global enabled
+    while _originals:
+        owner, attr, original = _originals.pop()
+        setattr(owner, attr, original)
+    enabled = False
+
+
+def reset():
+    "Forget everything recorded so far."
+    _timings.clear()
+    _counters.clear()
+
+
+@contextlib.contextmanager
+def profiling():
+    "Record for the duration of a with block."
+    enable()
+    try:
+        yield
+    finally:
+        disable()
+
+
+def count(name, n=1):
+    "Add n to the generation counter name; call only when enabled."
+    _counters[name] += n
+
+
+def snapshot():
+    '''
+    Return the recordings as a dictionary: operations maps each timed
+    operation to its calls, cumulative seconds and items, and counters
+    holds the generation counters.
+    '''
+    return {'operations': {name: {'calls': calls, 'seconds': seconds,
+                                  'items': items}
+                           for name, (calls, seconds, items)
+                           in sorted(_timings.items())},
+            'counters': {name: _counters[name] for name in COUNTERS}}
+
+
+def to_json(path=None):
+    "Return snapshot as JSON, and write it to path if given."
+    text = json.dumps(snapshot(), indent=1)
+    if path is not None:
+        with open(path, 'w') as fh:
+            fh.write(text + '\n')
+    return text
+
+
+def _resolve(module, path):
+    "The object holding the attribute path of fatgraph.module, and its name."
+    owner = importlib.import_module('fatgraph.' + module)
+    *parents, attr = path.split('.')
+    for parent in parents:
+        owner = getattr(owner, parent)
+    return owner, attr
+
+
+def _timed(name, original, items):
+    "Wrap the function or method original to record its calls as name."
+    if isinstance(original, (classmethod, staticmethod)):
+        return type(original)(_timed(name, original.__func__, items))
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = original(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        record = _timings.setdefault(name, [0, 0.0, 0])
+        record[0] += 1
+        record[1] += elapsed
+        record[2] += items(args, result)
+        return result
+    return wrapper
@@ -0,0 +1,56 @@
+import json
+import numpy as np
+from .fatgraph import Fatgraph, FatgraphB, filter_connected
+from . import fatgraph, fggen, instrument
+
+
+class TestInstrument(object):
+    def test_disabled(self):
+        attach, pmat = Fatgraph._attach, FatgraphB.__dict__['from_pmat']
+        arrays = Fatgraph.__dict__['from_arrays']
+        instrument.reset()
+        with instrument.profiling():
+            assert instrument.enabled
+            assert Fatgraph._attach is not attach
+        assert not instrument.enabled
+        assert Fatgraph._attach is attach
+        assert Fatgraph.__dict__['from_arrays'] is arrays
+        assert FatgraphB.__dict__['from_pmat'] is pmat
+        assert fatgraph.read_hbonds.__module__ == 'fatgraph.fatgraph'
+        fggen.generateall(3, 3)
+        assert instrument.snapshot()['operations'] == {}
+
+    def test_operations(self):
+        instrument.reset()
+        with instrument.profiling():
+            fg = Fatgraph([(1,2,3), (4,5,6)], [(1,4), (2,5), (3,6)])
+            assert fg.genus == 1
+            assert fg.isconnected()
+            FatgraphB.from_pmat(np.array([[0,0,0], [1,0,0], [0,0,0]]))
+            fatgraph.read_hbonds(['x ' * 12 + '5 1 ' + 'x ' * 7 + 'AA__UU'])
+            Fatgraph.from_arrays([0, 3], [1, 2, 3], [1, 2])
+        operations = instrument.snapshot()['operations']
+        assert operations['boundaries'] == dict(
+            operations['boundaries'], calls=1, items=1)
+        assert operations['isconnected']['items'] == 2
+        assert operations['from_pmat']['items'] == 2
+        assert operations['read_hbonds']['items'] == 1
+        assert operations['construction'] == dict(
+            operations['construction'], calls=3, items=6 + 6 + 3)
+        assert all(op['seconds'] >= 0 for op in operations.values())
+
+    def test_counters(self, tmp_path):
+        instrument.reset()
+        with instrument.profiling():
+            graphs = list(fggen.iter_all(3, 3, 3, genus=0))
+            connected = list(filter_connected(fggen.iter_all(3, 3)))
+            fgbs = fggen.generateallB(4, 4)
+        counters = instrument.snapshot()['counters']
+        assert counters['produced'] == len(graphs) + 15 + 105
+        assert counters['rejected_disconnected'] == 15 - len(connected)
+        assert counters['producedB'] == len(fgbs)
+        assert counters['pruned'] > 0
+        path = tmp_path / 'profile.json'
+        instrument.to_json(str(path))
+        assert json.loads(path.read_text()) == \
+            json.loads(json.dumps(instrument.snapshot()))
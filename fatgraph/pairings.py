@@ -0,0 +1,185 @@
+'''
+Numbering of the pairings enumerated by fggen.generateall. The graphs
+on vertices of given valences with l marked points are listed subset
+by subset, the marked points taken in the order of
+itertools.combinations, and within a subset the remaining half-edges
+are paired in the order of fggen.all_pairs. Pairings numbers them
+from 0 in that order, so any position of a long enumeration can be
+reached without generating what comes before it, e.g. to resume an
+interrupted run or to split one over several machines.
+'''
+
+from math import comb
+
+
+def nmatchings(n):
+    '''
+    Number of pairings all_pairs yields for a list of n half-edges:
+    (n-1)!! for even n, and n times that of n-1 for odd n, one for
+    each choice of the half-edge left out.
+    '''
+    count = 1
+    if n % 2:
+        count, n = n, n - 1
+    for k in range(n - 1, 0, -2):
+        count *= k
+    return count
+
+
+class Pairings(object):
+    '''
+    The edge lists of fggen.generateall(*valences, l=l), in the same
+    order. total is their number, unrank(i) returns the i'th one and
+    rank is its inverse, and iter(start, stop) yields those from start
+    to stop. When the number of half-edges left after the marked
+    points is odd, generateall also leaves out each of them in turn
+    and so lists every graph more than once; rank returns the first
+    position.
+    '''
+
+    def __init__(self, *valences, l=0):
+        self.valences = valences
+        self.l = l
+        self.halfedges = tuple(range(1, sum(valences) + 1))
+        n = len(self.halfedges)
+        self.nsubsets = comb(n, l)
+        self.nmatchings = nmatchings(n - l) if l <= n else 0
+        self.total = self.nsubsets * self.nmatchings
+
+    def __repr__(self):
+        return 'Pairings({}, l={})'.format(
+            ', '.join(map(str, self.valences)), self.l)
+
+    def unrank(self, index):
+        "The edge list at position index."
+        for edges in self.iter(index, index + 1):
+            return edges
+        raise IndexError('Pairings index out of range')
+
+    def rank(self, edges, marked=None):
+        '''
+        Position of the edge list with the given edges, in any order,
+        and marked points marked, by default the first l unpaired
+        half-edges.
+        '''
+        partner = {}
+        for a, b in edges:
+            if a in partner or b in partner or a == b:
+                raise ValueError('Edges are not unique')
+            partner[a], partner[b] = b, a
+        if not partner.keys() <= set(self.halfedges):
+            raise ValueError('Edges do not connect to vertices')
+        unpaired = [h for h in self.halfedges if h not in partner]
+        if marked is None:
+            marked = unpaired[:self.l]
+        marked = sorted(marked)
+        left = len(self.halfedges) - self.l
+        if len(marked) != self.l or len(unpaired) != self.l + left % 2 \
+           or not set(marked) <= set(unpaired):
+            raise ValueError('Not a pairing of {!r}'.format(self))
+        index = _rankcombination([h - 1 for h in marked],
+                                 len(self.halfedges))
+        lst = [h for h in self.halfedges if h not in set(marked)]
+        r = 0
+        if len(lst) % 2:
+            dropped = [h for h in lst if h not in partner][0]
+            i = lst.index(dropped)
+            r += i * nmatchings(len(lst) - 1)
+            del lst[i]
+        while lst:
+            i = lst.index(partner[lst[0]])
+            r += (i - 1) * nmatchings(len(lst) - 2)
+            lst = lst[1:i] + lst[i+1:]
+        return index * self.nmatchings + r
+
+    def iter(self, start=0, stop=None):
+        '''
+        Yield the edge lists at positions start, start + 1, ... up to
+        stop, by default the end, at the cost of generateall after the
+        first one.
+        '''
+        stop = self.total if stop is None else min(stop, self.total)
+        if start >= stop:
+            return
+        remaining = stop - start
+        s, r = divmod(start, self.nmatchings)
+        n = len(self.halfedges)
+        subset = _unrankcombination(s, n, self.l)
+        while subset is not None:
+            exclude = set(self.halfedges[k] for k in subset)
+            lst = [h for h in self.halfedges if h not in exclude]
+            for edges in _matchings(lst, r):
+                yield edges
+                remaining -= 1
+                if not remaining:
+                    return
+            r = 0
+            subset = _nextcombination(subset, n)
+
+    def ranges(self, parts):
+        '''
+        Split the positions into parts consecutive (start, stop)
+        ranges of nearly equal size.
+        '''
+        bounds = [self.total * k // parts for k in range(parts + 1)]
+        return list(zip(bounds, bounds[1:]))
+
+
+def _matchings(lst, r):
+    "all_pairs(lst), starting with the r'th pairing it yields."
+    if not lst:
+        yield []
+        return
+    if len(lst) % 2:
+        first, r = divmod(r, nmatchings(len(lst) - 1))
+        for i in range(first, len(lst)):
+            yield from _matchings(lst[:i] + lst[i+1:], r)
+            r = 0
+        return
+    first, r = divmod(r, nmatchings(len(lst) - 2))
+    a = lst[0]
+    for i in range(first + 1, len(lst)):
+        for rest in _matchings(lst[1:i] + lst[i+1:], r):
+            yield [(a, lst[i])] + rest
+        r = 0
+
+
+def _rankcombination(subset, n):
+    "Position of the sorted subset of range(n) in itertools.combinations."
+    k = len(subset)
+    index = 0
+    low = 0
+    for j, c in enumerate(subset):
+        for x in range(low, c):
+            index += comb(n - 1 - x, k - 1 - j)
+        low = c + 1
+    return index
+
+
+def _unrankcombination(index, n, k):
+    "Inverse of _rankcombination, or None if index is too large."
+    if index >= comb(n, k):
+        return None
+    subset = []
+    x = 0
+    for j in range(k):
+        while True:
+            count = comb(n - 1 - x, k - 1 - j)
+            if index < count:
+                break
+            index -= count
+            x += 1
+        subset.append(x)
+        x += 1
+    return subset
+
+
+def _nextcombination(subset, n):
+    "The subset following subset in itertools.combinations, or None."
+    k = len(subset)
+    for j in range(k - 1, -1, -1):
+        if subset[j] < n - k + j:
+            subset = subset[:j] + list(range(subset[j] + 1,
+                                             subset[j] + 1 + k - j))
+            return subset
+    return None
@@ -0,0 +1,47 @@
+import pytest
+from . import fggen
+from .pairings import Pairings, nmatchings
+
+CASES = [((3,3), 0), ((4,), 0), ((2,4), 2), ((1,3,2), 0), ((3,), 1),
+         ((3,2), 0), ((2,2,1), 1), ((4,4), 1), ((), 0), ((2,), 3)]
+
+
+class TestPairings(object):
+    def test_nmatchings(self):
+        assert [nmatchings(n) for n in range(7)] == [1, 1, 1, 3, 3, 15, 15]
+
+    def test_order(self):
+        for valences, l in CASES:
+            pairings = Pairings(*valences, l=l)
+            expected = [fg.edges for fg in fggen.generateall(*valences, l=l)]
+            assert pairings.total == len(expected)
+            assert [tuple(e) for e in pairings.iter()] == expected
+            for i, edges in enumerate(expected):
+                assert tuple(pairings.unrank(i)) == edges
+                assert [tuple(e) for e in pairings.iter(i, i + 3)] == \
+                    expected[i:i+3]
+            with pytest.raises(IndexError):
+                pairings.unrank(pairings.total)
+
+    def test_rank(self):
+        for valences, l in CASES:
+            pairings = Pairings(*valences, l=l)
+            first = {}
+            for i, edges in enumerate(pairings.iter()):
+                first.setdefault(frozenset(edges), i)
+                assert pairings.rank(edges[::-1]) == first[frozenset(edges)]
+        pairings = Pairings(6, 6, 6, 6, l=2)
+        index = 123456789012
+        assert pairings.rank(pairings.unrank(index)) == index
+        with pytest.raises(ValueError):
+            pairings.rank([(1, 2)])
+        with pytest.raises(ValueError):
+            Pairings(3, 3).rank([(1, 2), (2, 3), (4, 5)])
+
+    def test_ranges(self):
+        pairings = Pairings(4, 4, l=1)
+        ranges = pairings.ranges(7)
+        assert ranges[0][0] == 0 and ranges[-1][1] == pairings.total
+        assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+        assert sum(len(list(pairings.iter(*r))) for r in ranges) == \
+            pairings.total
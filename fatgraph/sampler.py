@@ -0,0 +1,81 @@
+'''
+Monte Carlo sampling of fatgraphs with a given vertex structure, for
+sizes where fggen cannot enumerate every pairing. Pairings are drawn
+uniformly, as a random element of the output of fggen.generateall,
+and their genus is computed for whole batches at once with NumPy.
+'''
+
+from collections import Counter
+
+import numpy as np
+
+from .arrayperm import count_cycles
+
+
+class _Vertices(object):
+    '''
+    Vertex permutation of the given valences on half-edges
+    0, ..., H-1, and what is needed to turn cycle counts into the
+    genus of Fatgraph.genus.
+    '''
+
+    def __init__(self, valences):
+        self.size = sum(valences)
+        self.sigma = np.arange(self.size)
+        start = 0
+        for v in valences:
+            self.sigma[start:start+v] = np.roll(np.arange(start, start+v),
+                                                -1)
+            start += v
+        starts = np.cumsum([0] + list(valences))[:-1]
+        self.lonely = starts[np.asarray(valences) == 1]
+        self.nvertices = len([v for v in valences if v > 1])
+
+
+def genus_batches(*args, l=0, n=10000, batch=4096, seed=None):
+    '''
+    Yield arrays with the genus of n uniformly random graphs on
+    vertices of valences args with l marked points, batch graphs at a
+    time. seed is passed to numpy.random.default_rng, so it may be an
+    int or a Generator.
+    '''
+    vertices = _Vertices(args)
+    h = vertices.size
+    if l > h:
+        raise ValueError('More marked points than half-edges.')
+    if (h - l) % 2:
+        # generateall leaves one more half-edge unpaired, uniformly.
+        l += 1
+    rng = np.random.default_rng(seed)
+    m = (h - l) // 2
+    while n > 0:
+        size = min(batch, n)
+        n -= size
+        order = rng.permuted(np.broadcast_to(np.arange(h), (size, h)),
+                             axis=1)
+        a, b = order[:, l::2], order[:, l+1::2]
+        eps = np.broadcast_to(np.arange(h), (size, h)).copy()
+        np.put_along_axis(eps, a, b, axis=1)
+        np.put_along_axis(eps, b, a, axis=1)
+        nboundaries = count_cycles(vertices.sigma[eps])
+        if len(vertices.lonely):
+            nboundaries -= np.isin(order[:, :l], vertices.lonely).sum(axis=1)
+        if vertices.nvertices == 0:
+            yield np.zeros(size, dtype=int)
+        else:
+            yield np.trunc((2 - vertices.nvertices + m - nboundaries)
+                           / 2).astype(int)
+
+
+def sample_genus(*args, l=0, n=10000, batch=4096, seed=None):
+    '''
+    Return a dictionary mapping genus to the number of graphs of that
+    genus among n uniformly random graphs, see genus_batches. The
+    result can be compared with fggen.count_by_genus after
+    normalising.
+    '''
+    counts = Counter()
+    for genus in genus_batches(*args, l=l, n=n, batch=batch, seed=seed):
+        values, numbers = np.unique(genus, return_counts=True)
+        counts.update(dict(zip(values.tolist(), numbers.tolist())))
+    return dict(sorted(counts.items()))
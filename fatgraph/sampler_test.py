@@ -0,0 +1,22 @@
+from . import fggen
+from . import sampler
+
+
+class TestSampler(object):
+    def test_reproducible(self):
+        a = sampler.sample_genus(4,4,4, n=500, seed=1)
+        b = sampler.sample_genus(4,4,4, n=500, batch=64, seed=1)
+        assert sum(a.values()) == 500
+        assert a == sampler.sample_genus(4,4,4, n=500, seed=1)
+        assert sum(b.values()) == 500
+
+    def test_distribution(self):
+        for valences, l in [((4,4,4), 0), ((2,3,3), 2), ((1,3,2), 0),
+                            ((3,3), 1), ((8,), 0)]:
+            exact = fggen.count_by_genus(*valences, l=l)
+            total = sum(exact.values())
+            n = 20000
+            sample = sampler.sample_genus(*valences, l=l, n=n, seed=0)
+            assert set(sample) <= set(exact)
+            for genus, count in exact.items():
+                assert abs(sample.get(genus, 0) / n - count / total) < 0.02
@@ -0,0 +1,75 @@
+class UnionFind(object):
+    '''
+    Disjoint sets over 0, 1, ..., n-1 with union by size and path
+    halving. ncomponents holds the current number of sets.
+    '''
+
+    __slots__ = ('parent', 'size', 'ncomponents')
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.ncomponents = n
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        '''
+        Merge the sets containing i and j. Return False if they were
+        already the same set, True otherwise.
+        '''
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return False
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        self.ncomponents -= 1
+        return True
+
+
+class UndoableUnionFind(UnionFind):
+    '''
+    UnionFind whose unions can be undone, most recent first. It does
+    no path compression, so find is O(log n) by union by size.
+    '''
+
+    __slots__ = ('history',)
+
+    def __init__(self, n):
+        super().__init__(n)
+        self.history = []
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            self.history.append(None)
+            return False
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        self.ncomponents -= 1
+        self.history.append(j)
+        return True
+
+    def undo(self):
+        "Undo the last call to union."
+        j = self.history.pop()
+        if j is not None:
+            i = self.parent[j]
+            self.parent[j] = j
+            self.size[i] -= self.size[j]
+            self.ncomponents += 1
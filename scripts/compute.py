@@ -2,29 +2,136 @@
 
 PKL_DIR = '/home/au447708/QGM/metastr/data/sim_fatgraphs'
 
-import pathlib, argparse, pickle
-#from .fatgraph import Fatgraph
-import fatgraph
+# fatgraph (and with it numpy and permutation) is imported only by the
+# functions that need it, so that e.g. -q or -b start quickly.
+import pathlib, argparse, pickle, sys, fnmatch, functools
 
-def main(name, g, b, s, k, q):
+_corpora = {}
+_caches = {}
+
+def load(name, corpus=None):
+    '''
+    Return vertices, edges, interior edges and sequence of a protein,
+    from the packed corpus file if given, otherwise from PKL_DIR.
+    '''
+    if corpus is not None:
+        if corpus not in _corpora:
+            from fatgraph.corpus import Corpus
+            _corpora[corpus] = Corpus(corpus)
+        return _corpora[corpus][name]
     with open('{}/{}.pkl'.format(PKL_DIR, name), 'rb') as fh:
-        vertices, edges, in_edges, seq = pickle.load(fh)
-    f = fatgraph.Fatgraph(vertices, edges)
+        return pickle.load(fh)
+
+def genus(vertices, edges, cache=None):
+    '''
+    Genus of the fatgraph, looked up in and stored to the invariant
+    cache file if given.
+    '''
+    if cache is None:
+        import fatgraph
+        return fatgraph.Fatgraph(vertices, edges).genus
+    from fatgraph.cache import InvariantCache, contenthash
+    if cache not in _caches:
+        from multiprocessing.util import Finalize
+        _caches[cache] = InvariantCache(cache)
+        # Write the buffered entries at exit, in worker processes too.
+        Finalize(_caches[cache], _caches[cache].close, exitpriority=0)
+    data = _caches[cache].get(contenthash(vertices, edges))
+    if data is None:
+        import fatgraph
+        data = fatgraph.Fatgraph(vertices, edges).invariants(_caches[cache])
+    return data['genus']
+
+def main(name, g, b, s, k, q, corpus=None, cache=None):
+    vertices, edges, in_edges, seq = load(name, corpus)
     if g:
-        print(len(f.vertices), f.genus, name)
+        print(len(vertices), genus(vertices, edges, cache), name)
     elif b:
-        print(len(f.vertices))
+        print(len(vertices))
     elif s:
-        print('\t'.join([str(len(v)//2) for v in f.vertices]))
+        print('\t'.join([str(len(v)//2) for v in vertices]))
     elif k:
-        print(sum([len(v) for v in f.vertices])//2, f.genus, name)
+        print(sum([len(v) for v in vertices])//2,
+              genus(vertices, edges, cache), name)
     elif q:
         print(name, seq)
 
+def header(g, b, s, k, q):
+    '''
+    Columns of the batch TSV. -g and -k give the same columns as in
+    single mode, -s gives the strand counts separated by commas.
+    '''
+    cols = ['name']
+    if g or b:
+        cols.append('sheets')
+    if g or k:
+        cols.append('genus')
+    if s:
+        cols.append('strands')
+    if k:
+        cols.append('chords')
+    if q:
+        cols.append('sequence')
+    return cols
+
+def row(g, b, s, k, q, corpus, cache, name):
+    vertices, edges, in_edges, seq = load(name, corpus)
+    cols = [name]
+    if g or b:
+        cols.append(len(vertices))
+    if g or k:
+        cols.append(genus(vertices, edges, cache))
+    if s:
+        cols.append(','.join([str(len(v)//2) for v in vertices]))
+    if k:
+        cols.append(sum([len(v) for v in vertices])//2)
+    if q:
+        cols.append(seq)
+    return '\t'.join(str(c) for c in cols)
+
+def names(args):
+    '''
+    Protein names from the command line, the --list file (- for
+    stdin) and the --glob pattern, in that order.
+    '''
+    result = list(args.name)
+    if args.list == '-':
+        result.extend(line.strip() for line in sys.stdin if line.strip())
+    elif args.list:
+        with open(args.list) as fh:
+            result.extend(line.strip() for line in fh if line.strip())
+    if args.glob:
+        if args.corpus:
+            from fatgraph.corpus import Corpus
+            with Corpus(args.corpus) as c:
+                available = list(c)
+        else:
+            available = sorted(p.stem for p in
+                               pathlib.Path(PKL_DIR).glob('*.pkl'))
+        result.extend(fnmatch.filter(available, args.glob))
+    return result
+
+def batch(names, g, b, s, k, q, corpus=None, cache=None, jobs=1,
+          out=sys.stdout):
+    '''
+    Write one TSV row per protein in names, computed in this process
+    or by jobs worker processes, in the order of names.
+    '''
+    print('\t'.join(header(g, b, s, k, q)), file=out)
+    work = functools.partial(row, g, b, s, k, q, corpus, cache)
+    if jobs == 1:
+        for line in map(work, names):
+            print(line, file=out)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as executor:
+            for line in executor.map(work, names, chunksize=64):
+                print(line, file=out)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('name',
+    parser.add_argument('name', nargs='*',
                         help='Protein name, id and chain id.')
     parser.add_argument('-g', '--genus', action='store_true',
                         help='Compute genus for a given protein.')
@@ -36,6 +143,46 @@ if __name__ == '__main__':
                         help='Print genus and number of half-edges/2.')
     parser.add_argument('-q', '--sequence', action='store_true',
                         help='Print sequence.')
+    parser.add_argument('-c', '--corpus',
+                        help='Read proteins from this packed corpus file '
+                        'instead of PKL_DIR (see scripts/packcorpus.py).')
+    parser.add_argument('--cache',
+                        help='SQLite file caching genus and other '
+                        'invariants between runs.')
+    parser.add_argument('-l', '--list',
+                        help='Batch mode: read protein names, one per '
+                        'line, from this file or - for stdin.')
+    parser.add_argument('--glob',
+                        help='Batch mode: all proteins whose name matches '
+                        'this pattern, e.g. "1ab*".')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes in batch mode.')
+    parser.add_argument('-o', '--output',
+                        help='Write the batch TSV to this file.')
+    parser.add_argument('--profile', nargs='?', const='-',
+                        help='Write call counts and times of the fatgraph '
+                        'hot paths as JSON to this file, or stderr if no '
+                        'file is given. Worker processes of -j are not '
+                        'included.')
     args = parser.parse_args()
-    main(args.name, args.genus, args.beta, args.strands, args.chords,
-         args.sequence)
+    flags = (args.genus, args.beta, args.strands, args.chords,
+             args.sequence)
+    if args.profile:
+        from fatgraph import instrument
+        instrument.enable()
+    if len(args.name) == 1 and not (args.list or args.glob):
+        main(args.name[0], *flags, args.corpus, args.cache)
+    else:
+        todo = names(args)
+        if not todo:
+            parser.error('no protein names given or matched')
+        if args.output:
+            with open(args.output, 'w') as out:
+                batch(todo, *flags, args.corpus, args.cache, args.jobs,
+                      out)
+        else:
+            batch(todo, *flags, args.corpus, args.cache, args.jobs)
+    if args.profile == '-':
+        print(instrument.to_json(), file=sys.stderr)
+    elif args.profile:
+        instrument.to_json(args.profile)
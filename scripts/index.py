@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+'''
+Build and query an index of protein invariants, see fatgraph.index.
+
+    index.py build proteins.npz --corpus proteins.fgc
+    index.py query proteins.npz -w 'genus>=5' -w 'sheets>3' --sort genus
+    index.py aggregate proteins.npz genus mean --by sheets
+
+build only adds the proteins not indexed yet.
+'''
+
+import argparse, sys
+
+from fatgraph.index import AGGREGATES, COLUMNS, InvariantIndex, \
+    PickleDirectory
+
+# The pickle directory is configured in compute.py, which is installed
+# next to this script.
+from compute import PKL_DIR
+
+
+def build(args):
+    index = InvariantIndex.load(args.index)
+    if args.corpus:
+        from fatgraph.corpus import Corpus
+        with Corpus(args.corpus) as corpus:
+            added = index.update(corpus)
+    else:
+        added = index.update(PickleDirectory(args.pkl_dir))
+    index.save(args.index)
+    print('Added {} proteins, {} in {}'.format(added, len(index),
+                                               args.index))
+
+
+def query(args):
+    index = InvariantIndex.load(args.index)
+    columns = args.columns.split(',')
+    rows = index.query(args.where, args.sort, args.reverse, args.limit)
+    print('\t'.join(columns))
+    for row in rows:
+        row['strands'] = ','.join(map(str, row['strands']))
+        print('\t'.join(str(row[c]) for c in columns))
+
+
+def aggregate(args):
+    index = InvariantIndex.load(args.index)
+    result = index.aggregate(args.column, args.how, args.by, args.where)
+    if args.by is None:
+        print(result)
+    else:
+        print('{}\t{}'.format(args.by, args.how))
+        for key, value in result.items():
+            print('{}\t{}'.format(key, value))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('build', help='Add proteins to an index.')
+    p.add_argument('index', help='Index file (.npz), created if missing.')
+    p.add_argument('-c', '--corpus',
+                   help='Read proteins from this packed corpus file.')
+    p.add_argument('--pkl-dir', default=PKL_DIR,
+                   help='Read proteins from the {name}.pkl files here '
+                   'unless --corpus is given.')
+    p.set_defaults(func=build)
+
+    where = argparse.ArgumentParser(add_help=False)
+    where.add_argument('index', help='Index file (.npz).')
+    where.add_argument('-w', '--where', action='append', default=[],
+                       help='Condition such as "genus>=5" or '
+                       '"name=1ab*"; may be repeated.')
+
+    p = commands.add_parser('query', parents=[where],
+                            help='Print the matching proteins as TSV.')
+    p.add_argument('--sort', choices=('name',) + COLUMNS)
+    p.add_argument('-r', '--reverse', action='store_true')
+    p.add_argument('-n', '--limit', type=int)
+    p.add_argument('--columns', default=','.join(
+        ('name',) + COLUMNS + ('strands',)),
+                   help='Comma-separated columns to print.')
+    p.set_defaults(func=query)
+
+    p = commands.add_parser('aggregate', parents=[where],
+                            help='Aggregate a column over the matching '
+                            'proteins.')
+    p.add_argument('column', choices=COLUMNS)
+    p.add_argument('how', nargs='?', default='count', choices=AGGREGATES)
+    p.add_argument('--by', choices=COLUMNS,
+                   help='Aggregate separately for each value of this '
+                   'column.')
+    p.set_defaults(func=aggregate)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except ValueError as e:
+        sys.exit(str(e))
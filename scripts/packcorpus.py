@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+import argparse
+from fatgraph.corpus import Corpus, convert_pickles
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Pack the {name}.pkl files of a directory into a '
+        'single memory-mapped corpus file.')
+    parser.add_argument('pkl_dir', help='Directory of pickled proteins.')
+    parser.add_argument('corpus', help='Corpus file to write.')
+    args = parser.parse_args()
+    n = convert_pickles(args.pkl_dir, args.corpus)
+    with Corpus(args.corpus) as corpus:
+        assert len(corpus) == n
+    print('Packed {} proteins into {}'.format(n, args.corpus))
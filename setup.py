@@ -14,5 +14,6 @@ setup(
     license='BSD 3-Clause License',
     requires=['permutation',],
     package_dir={'fatgraph': 'fatgraph'},
-    scripts=['scripts/compute.py',]
+    scripts=['scripts/compute.py', 'scripts/packcorpus.py',
+             'scripts/index.py']
 )